@@ -1,13 +1,19 @@
 import os
-from flask import Flask, request, make_response, jsonify
+from flask import Flask, request, make_response, jsonify, Response, stream_with_context
 from flask_migrate import Migrate
-from flask_restful import Api, Resource
+from flask_restful import Api, Resource, abort
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token, get_jwt, create_refresh_token
-from backend.models import db, UserProfile, Rating, Post, User, Notifications, UserFavourites, Category, followers, Settings, Attachment, Tag, Messages, Comment
-from werkzeug.security import generate_password_hash
+from backend.models import db, UserProfile, Rating, Post, User, Notifications, UserFavourites, Category, followers, Settings, Attachment, Tag, Messages, Conversation, Comment, PostStats, RatingStatus, serialize_posts, serialize_messages, make_excerpt, POST_FIELDS, post_columns
+from backend.pagination import Keyset, paginate, paginated_response, page_limit, encode_cursor, decode_cursor
+from backend import timeline, trending, search, ratings, batch, reads, revocation, follows, recommendations, stream, notify, retention, conversations, comments, encryption
+from backend.principal import claims_for, from_claims, current_principal
+from backend.passwords import hash_password, verify_password
+from backend.caching import collection_versions, validators, with_validators, not_modified
 from werkzeug.utils import secure_filename
+from sqlalchemy import func, update
+from sqlalchemy.orm import load_only
 from dotenv import load_dotenv
-from datetime import timedelta
+from datetime import timedelta, datetime
 from flask_cors import CORS
 
 load_dotenv()
@@ -16,6 +22,11 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY')
+app.config['JWT_REVOCATION_DATABASE_URI'] = os.environ.get('JWT_REVOCATION_DATABASE_URI')
+app.config['MESSAGE_ENCRYPTION_KEYS'] = os.environ.get('MESSAGE_ENCRYPTION_KEYS')
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', stream.MAX_STREAMS))
+app.config['MESSAGE_ENCRYPTION_EPHEMERAL_KEY'] = os.environ.get('MESSAGE_ENCRYPTION_EPHEMERAL_KEY') == '1'
+encryption.check_keys(app)
 CORS(app)
 
 db.init_app(app)
@@ -26,19 +37,31 @@ jwt = JWTManager(app)
 UPLOAD_FOLDER = 'upload_folder'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'docx'}
 
-blacklist = set()
 expires = timedelta(hours=24)
 
 @jwt.token_in_blocklist_loader
 def check_if_token_in_blacklist(jwt_header, jwt_payload):
-    jti = jwt_payload['jti']
-    return jti in blacklist
+    # Tokens issued before principal claims were added can't be checked
+    # against a token version, so they have to be renewed through /login.
+    if 'token_version' not in jwt_payload:
+        return True
+    store = revocation.store()
+    return store.is_revoked(jwt_payload['jti']) or store.is_revoked(
+        revocation.version_key(jwt_payload['sub'], jwt_payload['token_version'])
+    )
+
+@jwt.user_lookup_loader
+def load_principal(jwt_header, jwt_data):
+    return from_claims(jwt_data)
 
 @app.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
 def refresh():
     identity = get_jwt_identity()
-    access_token = create_access_token(identity=identity)
+    user = db.session.get(User, identity)
+    if not user or user.token_version != get_jwt()['token_version']:
+        return jsonify({'message': 'Token has been revoked'}), 401
+    access_token = create_access_token(identity=identity, additional_claims=claims_for(user))
     return jsonify(access_token=access_token), 200
 
 @app.route('/protected', methods=['GET'])
@@ -61,9 +84,13 @@ def login():
         return {'message': 'Missing username or password'}, 400
     
     user = User.query.filter_by(username=username).first()
-    if user and user.check_password(password):
-        access_token = create_access_token(identity=user.id, expires_delta=expires)
-        refresh_token = create_refresh_token(identity=user.id)
+    matches, new_hash = verify_password(user.password_hash, password) if user else (False, None)
+    if matches:
+        if new_hash:
+            user.password_hash = new_hash
+            db.session.commit()
+        access_token = create_access_token(identity=user.id, expires_delta=expires, additional_claims=claims_for(user))
+        refresh_token = create_refresh_token(identity=user.id, additional_claims=claims_for(user))
         return {
             'access_token': access_token,
             'refresh_token': refresh_token
@@ -75,8 +102,8 @@ def login():
 @app.route('/logout', methods=['DELETE'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti']
-    blacklist.add(jti)
+    token = get_jwt()
+    revocation.store().revoke(token['jti'], token.get('exp'))
     return jsonify({'message': 'Logged out successfully'}), 200
 
 # User Resources
@@ -96,7 +123,7 @@ class UserResource(Resource):
         if len(data['password']) < 8:
             return {'message': 'Password must be at least 8 characters long'}, 400
         
-        hashed_password = generate_password_hash(data['password'])
+        hashed_password = hash_password(data['password'])
         user = User(
             username=data['username'],
             email=data['email'],
@@ -109,9 +136,7 @@ class UserResource(Resource):
     
     @jwt_required()
     def get(self):
-        users = User.query.all()
-        result = [user.to_dict() for user in users]
-        return make_response(jsonify(result), 200)
+        return paginated_response(User.query, Keyset(User.id, descending=False))
     
 class SpecificUser(Resource):
     @jwt_required()
@@ -121,8 +146,7 @@ class SpecificUser(Resource):
     
     @jwt_required()
     def put(self, id):
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = current_principal()
         user = User.query.get_or_404(id)
         data = request.get_json()
 
@@ -142,7 +166,7 @@ class SpecificUser(Resource):
         if 'password' in data:
             if 'current_password' not in data or not user.check_password(data['current_password']):
                 return {'message': 'Incorrect current password'}, 401
-            user.password_hash = generate_password_hash(data['password'])
+            user.password_hash = hash_password(data['password'])
         
         if 'followers_count' in data:
             user.followers_count = data['followers_count']
@@ -150,22 +174,28 @@ class SpecificUser(Resource):
         if 'following_count' in data:
             user.following_count = data['following_count']
         
-        if 'is_admin' in data and current_user.is_admin:
+        revoked_version = None
+        if 'is_admin' in data and current_user.is_admin and bool(data['is_admin']) != bool(user.is_admin):
             user.is_admin = data['is_admin']
+            revoked_version = user.token_version
+            user.token_version = revoked_version + 1
 
         db.session.commit()
+        if revoked_version is not None:
+            revocation.revoke_token_version(user.id, revoked_version)
         return user.to_dict()
     
     @jwt_required()
     def delete(self, id):
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = current_principal()
         user = User.query.get_or_404(id)
         if current_user.id != user.id and not current_user.is_admin:
             return {'message': 'Unauthorized'}, 403
 
+        token_version = user.token_version
         db.session.delete(user)
         db.session.commit()
+        revocation.revoke_token_version(id, token_version)
         return {'message': 'User deleted'}, 204
 
 class CheckPasswordResource(Resource):
@@ -182,9 +212,14 @@ class CheckPasswordResource(Resource):
             return {'message': 'Incorrect password'}, 401
         
 class RecommendedUsers(Resource):
+    @jwt_required(optional=True)
     def get(self):
-        users = User.query.filter_by(is_admin=False).order_by(User.followers_count.desc()).limit(10).all()
-        result = [user.to_dict() for user in users]
+        # Personal suggestions for signed in users who have any yet; everyone
+        # else gets the most followed users.
+        user_id = get_jwt_identity()
+        result = recommendations.recommended_users(user_id) if user_id else []
+        if not result:
+            result = reads.recommended_users()
         return make_response(jsonify(result), 200)
 
 api.add_resource(UserResource, '/users')
@@ -196,9 +231,7 @@ api.add_resource(RecommendedUsers, '/recommended-users')
 class UserProfiles(Resource):
     @jwt_required()
     def get(self):
-        user_profiles = UserProfile.query.all()
-        result = [up.to_dict() for up in user_profiles]
-        return make_response(jsonify({'data': result}), 200)
+        return paginated_response(UserProfile.query, Keyset(UserProfile.id, descending=False))
     
     @jwt_required()
     def post(self):
@@ -333,7 +366,7 @@ class MyProfile(Resource):
        if 'username' in data:
            user.username = data['username']
        if 'password' in data:
-           user.password = generate_password_hash(data['password'])
+           user.password_hash = hash_password(data['password'])
 
        db.session.commit()
        return make_response(jsonify({'message': 'User profile updated'}), 200)
@@ -346,43 +379,47 @@ api.add_resource(MyProfile, '/my-profile')
 # Followers Resources
 class Myfollowers(Resource):
     @jwt_required()
-    def get(self):
-        user_id = get_jwt_identity()        
-        
-        follower_ids = db.session.query(followers.c.follower_id).filter(followers.c.followed_id == user_id).all()
-        follower_ids = [f[0] for f in follower_ids]          
-        
-        following_ids = db.session.query(followers.c.followed_id).filter(followers.c.follower_id == user_id).all()
-        following_ids = [f[0] for f in following_ids]
-        
-        followers_list = User.query.filter(User.id.in_(follower_ids)).all()
-        
-        result = []
-        for user in followers_list:
-            user_dict = user.to_dict()
-            user_dict['is_followed'] = user.id in following_ids
-            result.append(user_dict)
-        
-        return make_response(jsonify(result), 200)
+    def get(self, user_id=None):
+        return follow_list_response(user_id, 'followers')
     
 class MyFollowing(Resource):
     @jwt_required()
-    def get(self):
-        user_id = get_jwt_identity()
-        following_ids = db.session.query(followers.c.followed_id).filter(followers.c.follower_id == user_id).all()
-        following_ids = [f[0] for f in following_ids]  
-        
-        following_list = User.query.filter(User.id.in_(following_ids)).all()
-        
-        result = [user.to_dict() for user in following_list]
-        
-        return make_response(jsonify(result), 200)
+    def get(self, user_id=None):
+        return follow_list_response(user_id, 'following')
+
+def follow_list_response(user_id, direction):
+    viewer_id = get_jwt_identity()
+    if user_id is None:
+        user_id = viewer_id
+    elif not db.session.query(User.id).filter_by(id=user_id).first():
+        return make_response(jsonify({'message': 'User not found'}), 404)
+
+    query = reads.follow_list_query(user_id, viewer_id, direction)
+    return paginated_response(query, Keyset(followers.c.created_at, User.id), reads.follow_list_rows)
 
 class Follow(Resource):
     @jwt_required()
     def post(self):
         user_id = get_jwt_identity()
-        data = request.get_json()
+        data = request.get_json() or {}
+
+        # {'followed_user_ids': [...]} follows many users at once, e.g. from
+        # onboarding suggestions.
+        if 'followed_user_ids' in data:
+            followed_ids = data['followed_user_ids']
+            if not isinstance(followed_ids, list) or not followed_ids or not all(isinstance(id, int) for id in followed_ids):
+                return make_response(jsonify({'message': 'Invalid request data'}), 400)
+            if len(followed_ids) > follows.MAX_BULK_FOLLOWS:
+                return make_response(jsonify({'message': f'Bad Request: At most {follows.MAX_BULK_FOLLOWS} users per request'}), 400)
+
+            try:
+                added = follows.follow(user_id, followed_ids)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
+            return make_response(jsonify({'followed': added}), 200)
+
         followed_user_id = data.get('followed_user_id')
 
         if not followed_user_id:
@@ -391,24 +428,24 @@ class Follow(Resource):
         if user_id == followed_user_id:
             return make_response(jsonify({'message': 'Cannot follow yourself'}), 400)
 
-        existing_follow = db.session.query(followers).filter_by(follower_id=user_id, followed_id=followed_user_id).first()
-        if not existing_follow:
-            db.session.execute(followers.insert().values(follower_id=user_id, followed_id=followed_user_id))
-            db.session.commit()
-
-            User.query.filter_by(id=user_id).update({'following_count': User.following_count + 1})
-            User.query.filter_by(id=followed_user_id).update({'followers_count': User.followers_count + 1})
+        try:
+            added = follows.follow(user_id, [followed_user_id])
             db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
 
+        if added:
             return make_response(jsonify({'message': 'Followed successfully'}), 200)
-        else:
-            return make_response(jsonify({'message': 'Already following'}), 400)
+        if not db.session.query(User.id).filter_by(id=followed_user_id).first():
+            return make_response(jsonify({'message': 'User not found'}), 404)
+        return make_response(jsonify({'message': 'Already following'}), 400)
         
 class Unfollow(Resource):
     @jwt_required()
     def delete(self):
         user_id = get_jwt_identity()
-        data = request.get_json()
+        data = request.get_json() or {}
         followed_user_id = data.get('followed_user_id')
 
         if not followed_user_id:
@@ -417,25 +454,28 @@ class Unfollow(Resource):
         if user_id == followed_user_id:
             return make_response(jsonify({'message': 'Cannot unfollow yourself'}), 400)
 
-        existing_follow = db.session.query(followers).filter_by(follower_id=user_id, followed_id=followed_user_id).first()
-        if existing_follow:
-            db.session.execute(followers.delete().where(followers.c.follower_id == user_id, followers.c.followed_id == followed_user_id))
-            db.session.commit()
-
-            User.query.filter_by(id=user_id).update({'following_count': User.following_count - 1})
-            User.query.filter_by(id=followed_user_id).update({'followers_count': User.followers_count - 1})
+        try:
+            removed = follows.unfollow(user_id, [followed_user_id])
             db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
 
+        if removed:
             return make_response(jsonify({'message': 'Unfollowed successfully'}), 200)
-        else:
-            return make_response(jsonify({'message': 'Not following this user'}), 400)
+        return make_response(jsonify({'message': 'Not following this user'}), 400)
     
-api.add_resource(Myfollowers, '/myfollowers')
-api.add_resource(MyFollowing, '/myfollowing')
+api.add_resource(Myfollowers, '/myfollowers', '/users/<int:user_id>/followers')
+api.add_resource(MyFollowing, '/myfollowing', '/users/<int:user_id>/following')
 api.add_resource(Follow, '/follow')
 api.add_resource(Unfollow, '/unfollow')
 
 # Ratings resources
+def rating_not_found_or_forbidden(post_id, id, action):
+    if not Rating.query.filter_by(post_id=post_id, id=id).first():
+        return make_response(jsonify({'message': 'Rating not found'}), 404)
+    return make_response(jsonify({'message': f'Forbidden: You are not authorized to {action} this rating'}), 403)
+
 class Ratings(Resource):
     @jwt_required()
     def post(self):
@@ -446,98 +486,84 @@ class Ratings(Resource):
         if status not in ['like', 'dislike']:
             return make_response(jsonify({'message': 'Bad Request: Invalid status'}), 400)
 
-        user_id = get_jwt_identity()
+        if not isinstance(post_id, int):
+            return make_response(jsonify({'message': 'Bad Request: Invalid post_id'}), 400)
 
-        post = Post.query.get(post_id)
-        if not post:
-            return make_response(jsonify({'message': 'Post not found'}), 404)
+        user_id = get_jwt_identity()
+        status = RatingStatus(status)
 
-        existing_rating = Rating.query.filter_by(post_id=post_id, user_id=user_id).first()
-        if existing_rating:
-            # Update the existing rating
-            return self.put(post_id, existing_rating.id)
-        
         try:
-            # Adjust the post's like/dislike count
-            if status == 'like':
-                post.likes_count += 1
-            elif status == 'dislike':
-                post.dislikes_count += 1
-
-            new_rating = Rating(
-                post_id=post_id,
-                user_id=user_id,
-                status=status
-            )
-            db.session.add(new_rating)
+            rows = ratings.upsert(user_id, {post_id: status})
+            if not rows:
+                db.session.rollback()
+                return make_response(jsonify({'message': 'Post not found'}), 404)
+
+            rating_id, _, _, previous_status = rows[0]
+            ratings.apply_changes(user_id, [(post_id, previous_status, status)])
             db.session.commit()
 
-            return make_response(jsonify({'message': 'Rating created'}), 201)
+            rating = {'id': rating_id, 'post_id': post_id, 'user_id': user_id, 'status': status.name}
+            if previous_status is None:
+                return make_response(jsonify({'message': 'Rating created', 'rating': rating}), 201)
+            return make_response(jsonify({'message': 'Rating updated', 'rating': rating}), 200)
         except Exception as e:
             db.session.rollback()
             return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
 
     @jwt_required()
     def put(self, post_id, id=None):
+        return RatingByPost().put(post_id, id)
+
+    @jwt_required()
+    def delete(self, post_id, id):
+        return RatingByPost().delete(post_id, id)
+
+class BulkRatings(Resource):
+    @jwt_required()
+    def post(self):
         data = request.get_json()
-        status = data.get('status')
-        if status not in ['like', 'dislike']:
-            return make_response(jsonify({'message': 'Bad Request: Invalid status'}), 400)
+        items = data.get('ratings') if data else None
+        if not isinstance(items, list) or not items:
+            return make_response(jsonify({'message': 'Bad Request: Missing ratings'}), 400)
+
+        if len(items) > ratings.MAX_BULK_RATINGS:
+            return make_response(jsonify({'message': f'Bad Request: At most {ratings.MAX_BULK_RATINGS} ratings per request'}), 400)
+
+        # Later entries for the same post win. A null status removes the rating.
+        statuses = {}
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('post_id'), int) or 'status' not in item or item['status'] not in ['like', 'dislike', None]:
+                return make_response(jsonify({'message': 'Bad Request: Each rating needs a post_id and a status of like, dislike or null'}), 400)
+            statuses[item['post_id']] = RatingStatus(item['status']) if item['status'] else None
 
         user_id = get_jwt_identity()
+        upserts = {post_id: status for post_id, status in statuses.items() if status}
+        removals = [post_id for post_id, status in statuses.items() if not status]
 
-        rating = Rating.query.filter_by(post_id=post_id, id=id).first()
-        if not rating:
-            return make_response(jsonify({'message': 'Rating not found'}), 404)
-        
-        if rating.user_id != user_id:
-            return make_response(jsonify({'message': 'Forbidden: You are not authorized to update this rating'}), 403)
-        
         try:
-            post = Post.query.get(post_id)
-            # Update the post's like/dislike counts
-            if rating.status == 'like':
-                post.likes_count -= 1
-            elif rating.status == 'dislike':
-                post.dislikes_count -= 1
-
-            if status == 'like':
-                post.likes_count += 1
-            elif status == 'dislike':
-                post.dislikes_count += 1
-
-            rating.status = status
+            changes = []
+            applied = set()
+            if upserts:
+                for _, post_id, status, previous_status in ratings.upsert(user_id, upserts):
+                    changes.append((post_id, previous_status, status))
+                    applied.add(post_id)
+            if removals:
+                for post_id, status in ratings.remove(user_id, removals):
+                    changes.append((post_id, status, None))
+                    applied.add(post_id)
+
+            ratings.apply_changes(user_id, changes)
             db.session.commit()
-
-            return make_response(jsonify({'message': 'Rating updated', 'rating': rating.to_dict()}), 200)
         except Exception as e:
             db.session.rollback()
             return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
 
-    @jwt_required()
-    def delete(self, post_id, id):
-        rating = Rating.query.filter_by(post_id=post_id, id=id).first()
-        if not rating:
-            return make_response(jsonify({'message': 'Rating not found'}), 404)
-        
-        user_id = get_jwt_identity()
-        if user_id != rating.user_id:
-            return make_response(jsonify({'message': 'Forbidden: You are not authorized to delete this rating'}), 403)
-        
-        try:
-            post = Post.query.get(post_id)
-            if rating.status == 'like':
-                post.likes_count -= 1
-            elif rating.status == 'dislike':
-                post.dislikes_count -= 1
+        return make_response(jsonify({
+            'message': 'Ratings applied',
+            'applied': len(applied),
+            'missing_post_ids': sorted(set(upserts) - applied)
+        }), 200)
 
-            db.session.delete(rating)
-            db.session.commit()
-            return make_response(jsonify({'message': 'Rating deleted'}), 200)
-        except Exception as e:
-            db.session.rollback()
-            return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
-        
 class RatingByPost(Resource):
     @jwt_required()
     def get(self, post_id, id):
@@ -555,53 +581,35 @@ class RatingByPost(Resource):
         if status not in ['like', 'dislike']:
             return make_response(jsonify({'message': 'Bad Request: Invalid status'}), 400)
 
-        rating = Rating.query.filter_by(post_id=post_id, id=id).first()
-        if not rating:
-            return make_response(jsonify({'message': 'Rating not found'}), 404)
-
         user_id = get_jwt_identity()
-        if rating.user_id != user_id:
-            return make_response(jsonify({'message': 'Forbidden: You are not authorized to update this rating'}), 403)
+        status = RatingStatus(status)
 
         try:
-            post = Post.query.get(post_id)
-            # Adjust the post's like/dislike count
-            if rating.status == 'like':
-                post.likes_count -= 1
-            elif rating.status == 'dislike':
-                post.dislikes_count -= 1
-
-            if status == 'like':
-                post.likes_count += 1
-            elif status == 'dislike':
-                post.dislikes_count += 1
-
-            rating.status = status
+            row = ratings.change(id, post_id, user_id, status)
+            if row is None:
+                db.session.rollback()
+                return rating_not_found_or_forbidden(post_id, id, 'update')
+
+            ratings.apply_changes(user_id, [(post_id, row.previous_status, status)])
             db.session.commit()
 
-            return make_response(jsonify({'message': 'Rating updated', 'rating': rating.to_dict()}), 200)
+            rating = {'id': id, 'post_id': post_id, 'user_id': user_id, 'status': status.name}
+            return make_response(jsonify({'message': 'Rating updated', 'rating': rating}), 200)
         except Exception as e:
             db.session.rollback()
             return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
     
     @jwt_required()
     def delete(self, post_id, id):
-        rating = Rating.query.filter_by(post_id=post_id, id=id).first()
-        if not rating:
-            return make_response(jsonify({'message': 'Rating not found'}), 404)
-        
         user_id = get_jwt_identity()
-        if user_id != rating.user_id:
-            return make_response(jsonify({'message': 'Forbidden: You are not authorized to delete this rating'}), 403)
-        
+
         try:
-            post = Post.query.get(post_id)
-            if rating.status == 'like':
-                post.likes_count -= 1
-            elif rating.status == 'dislike':
-                post.dislikes_count -= 1
+            rows = ratings.remove(user_id, [post_id], rating_id=id)
+            if not rows:
+                db.session.rollback()
+                return rating_not_found_or_forbidden(post_id, id, 'delete')
 
-            db.session.delete(rating)
+            ratings.apply_changes(user_id, [(post_id, status, None) for post_id, status in rows])
             db.session.commit()
             return make_response(jsonify({'message': 'Rating deleted'}), 200)
         except Exception as e:
@@ -611,13 +619,14 @@ class RatingByPost(Resource):
 class RatingsForPost(Resource):
     @jwt_required()
     def get(self, post_id):
-        ratings = Rating.query.filter_by(post_id=post_id).all()
-        if not ratings:
+        post_ratings, next_cursor = paginate(Rating.query.filter_by(post_id=post_id), Keyset(Rating.id, descending=False))
+        if not post_ratings and 'cursor' not in request.args:
             return make_response(jsonify({'message': 'No ratings found for this post'}), 404)
-        result = [rating.to_dict() for rating in ratings]
-        return make_response(jsonify(result), 200)
+        result = [rating.to_dict() for rating in post_ratings]
+        return make_response(jsonify({'data': result, 'next_cursor': next_cursor}), 200)
 
 api.add_resource(Ratings, '/ratings')
+api.add_resource(BulkRatings, '/ratings/bulk')
 api.add_resource(RatingByPost, '/posts/<int:post_id>/ratings/<int:id>')
 api.add_resource(RatingsForPost, '/posts/<int:post_id>/ratings')
 
@@ -635,13 +644,12 @@ class PostTags(Resource):
         if tag in post.tags:
             return make_response(jsonify({'message': 'Tag already exists for this post'}), 400)
         
-        user_id = get_jwt_identity()
-        user = User.query.get_or_404(user_id)
-        if not user.is_admin:
+        if not current_principal().is_admin:
             return make_response(jsonify({'message': 'Forbidden: You are not authorized to add tags to this post'}), 403)
         
         try:
             post.tags.append(tag)
+            post.updated_at = datetime.now()
             db.session.commit()
             return make_response(jsonify({'message': 'Tag added to post'}), 201)
         except Exception as e:
@@ -656,13 +664,12 @@ class PostTags(Resource):
         if tag not in post.tags:
             return make_response(jsonify({'message': 'Tag does not exist for this post'}), 404)
         
-        user_id = get_jwt_identity()
-        user = User.query.get_or_404(user_id)
-        if not user.is_admin:
+        if not current_principal().is_admin:
             return make_response(jsonify({'message': 'Forbidden: You are not authorized to remove tags from this post'}), 403)
 
         try:
             post.tags.remove(tag)
+            post.updated_at = datetime.now()
             db.session.commit()
             return make_response(jsonify({'message': 'Tag removed from post'}), 200)
         except Exception as e:
@@ -670,14 +677,22 @@ class PostTags(Resource):
             return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
         
     def get(self, post_id):
+        row = db.session.query(Post.updated_at).filter_by(id=post_id).first_or_404()
+        (tags_version, tags_modified), = collection_versions('tags')
+        etag, last_modified = validators(post_id, row.updated_at, tags_version, tags_modified)
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
         post = Post.query.get_or_404(post_id)
         tags = [tag.to_dict() for tag in post.tags]
-        return make_response(jsonify(tags), 200)
+        return with_validators(make_response(jsonify(tags), 200), etag, last_modified)
     
 class PostsByTag(Resource):
     def get(self, tag_id):
         tag = Tag.query.get_or_404(tag_id)
-        posts = [post.to_dict() for post in tag.posts]
+        fields, options = requested_post_fields()
+        posts = serialize_posts(tag.posts.options(*options), fields)
         return make_response(jsonify(posts), 200)
 
 api.add_resource(PostTags, '/posts/<int:post_id>/tags', '/posts/<int:post_id>/tags/<int:tag_id>')
@@ -699,7 +714,7 @@ class NotificationsResource(Resource):
         if not receiver_user:
             return make_response(jsonify({'message': 'User not found'}), 404)
         
-        new_notif = Notifications(user_id=receiver_id, content=content)
+        new_notif = Notifications(receiver_id=receiver_id, actor_id=user_id, content=content)
 
         try:
             db.session.add(new_notif)
@@ -712,13 +727,16 @@ class NotificationsResource(Resource):
     @jwt_required()
     def get(self):
         user_id = get_jwt_identity()
-        notifications = Notifications.query.filter_by(receiver_id=user_id).all()
+        notifications, next_cursor = paginate(
+            Notifications.query.filter_by(receiver_id=user_id),
+            Keyset(Notifications.created_at, Notifications.id)
+        )
         
-        if not notifications:
+        if not notifications and 'cursor' not in request.args:
             return make_response(jsonify({'message': 'No notifications found'}), 404)
 
         result = [notification.to_dict() for notification in notifications]
-        return make_response(jsonify(result), 200)
+        return make_response(jsonify({'data': result, 'next_cursor': next_cursor}), 200)
 
 class NotificationByID(Resource):
     @jwt_required()
@@ -761,7 +779,61 @@ class NotificationByID(Resource):
             db.session.rollback()
             return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
 
+class UnreadNotificationCount(Resource):
+    @jwt_required()
+    def get(self):
+        user_id = get_jwt_identity()
+        count = db.session.query(func.count(Notifications.id)).filter(
+            Notifications.receiver_id == user_id,
+            Notifications.read == False
+        ).scalar()
+        return make_response(jsonify({'unread_count': count}), 200)
+
+class MarkNotificationsRead(Resource):
+    @jwt_required()
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        up_to_id = data.get('up_to_id')
+        if up_to_id is not None and (not isinstance(up_to_id, int) or isinstance(up_to_id, bool)):
+            return make_response(jsonify({'message': 'Bad Request: up_to_id must be an integer'}), 400)
+
+        user_id = get_jwt_identity()
+        statement = update(Notifications).where(
+            Notifications.receiver_id == user_id,
+            Notifications.read == False
+        ).values(read=True)
+        if up_to_id is not None:
+            statement = statement.where(Notifications.id <= up_to_id)
+
+        try:
+            updated = db.session.execute(statement, execution_options={'synchronize_session': False}).rowcount
+            db.session.commit()
+            return make_response(jsonify({'message': 'Notifications marked as read', 'updated': updated}), 200)
+        except Exception as e:
+            db.session.rollback()
+            return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
+
+def archive_response(kind):
+    cursor = request.args.get('cursor')
+    position = None
+    if cursor:
+        position = decode_cursor(cursor, 2)
+        if not all(isinstance(value, int) for value in position):
+            return make_response(jsonify({'message': 'Bad Request: Invalid cursor'}), 400)
+
+    items, next_position = retention.archived(kind, get_jwt_identity(), page_limit(), position)
+    next_cursor = encode_cursor(next_position) if next_position else None
+    return make_response(jsonify({'data': items, 'next_cursor': next_cursor}), 200)
+
+class ArchivedNotifications(Resource):
+    @jwt_required()
+    def get(self):
+        return archive_response('notification')
+
 api.add_resource(NotificationsResource, '/notifications', '/users/me/notifications')
+api.add_resource(ArchivedNotifications, '/users/me/notifications/archive')
+api.add_resource(UnreadNotificationCount, '/users/me/notifications/unread-count')
+api.add_resource(MarkNotificationsRead, '/users/me/notifications/read')
 api.add_resource(NotificationByID, '/notifications/<int:id>')
 
 # User Favourites Resources
@@ -777,7 +849,7 @@ class UserFavouritesResource(Resource):
         
         post = Post.query.get_or_404(post_id)
         
-        if post.user_id == user_id:
+        if post.author_id == user_id:
             return make_response(jsonify({'message': 'You cannot favourite your own post'}), 400)
         
         existing_favourites = UserFavourites.query.filter_by(user_id=user_id, post_id=post_id).first()
@@ -787,6 +859,7 @@ class UserFavouritesResource(Resource):
         try:
             new_favourite = UserFavourites(user_id=user_id, post_id=post_id)
             db.session.add(new_favourite)
+            trending.refresh(post, favourites_delta=1)
             db.session.commit()
             return make_response(jsonify({'message': 'Post added to favourites'}), 201)
         except Exception as e:
@@ -803,6 +876,7 @@ class UserFavouritesResource(Resource):
 
         try:
             db.session.delete(existing_favourite)
+            trending.refresh(Post.query.get(post_id), favourites_delta=-1)
             db.session.commit()
             return make_response(jsonify({'message': 'Post removed from favourites'}), 200)
         except Exception as e:
@@ -828,11 +902,24 @@ class UserFavouritesResource(Resource):
 api.add_resource(UserFavouritesResource, '/users/me/favourites', '/users/me/favourites/<int:post_id>', '/users/me/favourites?post_id=<post_id>')
 
 # Posts Resources
+def requested_post_fields():
+    # ?fields=id,title,excerpt selects a sparse post representation; without
+    # it lists return the full Post.to_dict.
+    if not request.args.get('fields'):
+        return None, ()
+    fields = [name for name in request.args['fields'].split(',') if name]
+    unknown = [name for name in fields if name not in POST_FIELDS]
+    if unknown or not fields:
+        abort(400, message=f'Bad Request: fields must be a subset of {", ".join(POST_FIELDS)}')
+    return fields, (load_only(*post_columns(fields), raiseload=True),)
+
+def post_list_response(query):
+    fields, options = requested_post_fields()
+    return paginated_response(query.options(*options), Keyset(Post.created_at, Post.id), lambda posts: serialize_posts(posts, fields))
+
 class Posts(Resource):
     def get(self):
-        posts = Post.query.all()
-        result = [post.to_dict() for post in posts]
-        return make_response(jsonify(result), 200)
+        return post_list_response(Post.query)
     
     @jwt_required()
     def post(self):
@@ -848,10 +935,16 @@ class Posts(Resource):
         new_post = Post(
             title=title,
             content=content,
+            excerpt=make_excerpt(content),
             author_id=author_id
         )
         try:
             db.session.add(new_post)
+            db.session.flush()
+            PostStats.create_shards(new_post.id)
+            timeline.fan_out_post(new_post)
+            notify.new_post(new_post)
+            trending.track(new_post)
             db.session.commit()
             
             # Handle tags
@@ -869,10 +962,24 @@ class Posts(Resource):
             
 class PostByID(Resource):
     def get(self, id):
-        post = Post.query.filter_by(id=id).first()
-        if not post:
+        row = db.session.query(Post.updated_at).filter_by(id=id).first()
+        if not row:
             return make_response(jsonify({'message': 'Post not found'}), 404)
-        return make_response(jsonify(post.to_dict()), 200)
+
+        # Counters live in post_stats and don't touch updated_at, so their
+        # totals are part of the validator.
+        stats = PostStats.totals([id])[id]
+        (tags_version, tags_modified), (categories_version, categories_modified) = collection_versions('tags', 'categories')
+        etag, last_modified = validators(
+            id, row.updated_at, *(stats[name] for name in PostStats.COUNTERS),
+            tags_version, tags_modified, categories_version, categories_modified
+        )
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
+        post = Post.query.filter_by(id=id).first()
+        return with_validators(make_response(jsonify(post.to_dict()), 200), etag, last_modified)
     
     @jwt_required()
     def put(self, id):
@@ -893,6 +1000,7 @@ class PostByID(Resource):
         
         post.title = title
         post.content = content
+        post.excerpt = make_excerpt(content)
         try:
             db.session.commit()
             return make_response(jsonify({'message': 'Post updated successfully'}), 200)
@@ -911,6 +1019,10 @@ class PostByID(Resource):
             return make_response(jsonify({'message': 'Unauthorized'}), 403)
         
         try:
+            timeline.remove_post(post.id)
+            notify.remove_post(post.id)
+            trending.untrack(post.id)
+            PostStats.remove(post.id)
             db.session.delete(post)
             db.session.commit()
             return make_response(jsonify({'message': 'Post deleted successfully'}), 200)
@@ -922,37 +1034,34 @@ class Timeline(Resource):
     @jwt_required()
     def get(self):
         user_id = get_jwt_identity()
-
-        followed_users_ids = db.session.query(followers.c.followed_id).filter(followers.c.follower_id == user_id).subquery()
-
-        posts = Post.query.filter(
-            (Post.author_id.in_(followed_users_ids)) | (Post.author_id == user_id)
-        ).order_by(Post.created_at.desc()).all()
-
-        result = [post.to_dict() for post in posts]
-
-        return make_response(jsonify(result), 200)
+        fields, options = requested_post_fields()
+        posts, next_cursor = timeline.home_timeline(user_id, options)
+        result = serialize_posts(posts, fields)
+        return make_response(jsonify({'data': result, 'next_cursor': next_cursor}), 200)
     
 class PopularPosts(Resource):
     def get(self):
-        posts = Post.query.order_by(Post.likes_count.desc()).limit(5).all()
-        result = [post.to_dict() for post in posts]
-        return make_response(jsonify(result), 200) 
+        fields, _ = requested_post_fields()
+        result = reads.popular_posts(
+            limit=request.args.get('limit', trending.DEFAULT_LIMIT, type=int),
+            category_id=request.args.get('category_id', type=int),
+            window_hours=request.args.get('window_hours', type=int),
+            fields=fields
+        )
+        return make_response(jsonify(result), 200)
     
 class MyPosts(Resource):
     @jwt_required()
     def get(self):
         user_id = get_jwt_identity()
-        posts = Post.query.filter_by(author_id=user_id).order_by(Post.created_at.desc()).all()
-        result = [post.to_dict() for post in posts]
-        return make_response(jsonify(result), 200)
+        posts = Post.query.filter_by(author_id=user_id)
+        return post_list_response(posts)
 
 class UserPosts(Resource):
     @jwt_required()
     def get(self, user_id):
-        posts = Post.query.filter_by(author_id=user_id).order_by(Post.created_at.desc()).all()
-        result = [post.to_dict() for post in posts]
-        return make_response(jsonify(result), 200)
+        posts = Post.query.filter_by(author_id=user_id)
+        return post_list_response(posts)
 
 class CreatePosts(Resource):
     @jwt_required()
@@ -980,12 +1089,18 @@ class CreatePosts(Resource):
         new_post = Post(
             title=title,
             content=content,
+            excerpt=make_excerpt(content),
             author_id=user_id,
             category_id=category_id
         )
 
         try:
             db.session.add(new_post)
+            db.session.flush()
+            PostStats.create_shards(new_post.id)
+            timeline.fan_out_post(new_post)
+            notify.new_post(new_post)
+            trending.track(new_post)
             db.session.commit()
 
             if tags:
@@ -1012,9 +1127,12 @@ api.add_resource(UserPosts, '/users/<int:user_id>/posts')
 # Categories Resources
 class Categories(Resource):
     def get(self):
-        categories = Category.query.all()
-        result = [category.to_dict() for category in categories]
-        return make_response(jsonify(result), 200)
+        etag, last_modified = validators('categories', *collection_versions('categories')[0])
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
+        return with_validators(make_response(jsonify(reads.categories()), 200), etag, last_modified)
     
     @jwt_required()
     def post(self):
@@ -1033,10 +1151,15 @@ class Categories(Resource):
     
 class CategoryByID(Resource):
     def get(self, id):
+        etag, last_modified = validators('category', id, *collection_versions('categories')[0])
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
         category = Category.query.filter_by(id=id).first()
         if not category:
             return make_response(jsonify({'message': 'Category not found'}), 404)
-        return make_response(jsonify(category.to_dict()), 200)
+        return with_validators(make_response(jsonify(category.to_dict()), 200), etag, last_modified)
     
     @jwt_required()
     def put(self, id):
@@ -1157,7 +1280,8 @@ class CommentResource(Resource):
         if comment.user_id != user_id and not is_admin(user_id):
             return make_response(jsonify({'message': 'Unauthorized'}), 403)
 
-        db.session.delete(comment)
+        comments.remove(comment)
+        trending.refresh(Post.query.get(post_id))
         db.session.commit()
         return make_response(jsonify({'message': 'Comment deleted successfully'}), 200)
     
@@ -1167,66 +1291,99 @@ class CommentsListResource(Resource):
         data = request.get_json()
         user_id = get_jwt_identity()
         content = data.get('content')
+        parent_id = data.get('parent_id')
 
         if not content:
             return make_response(jsonify({'message': 'Bad Request: Missing content'}), 400)
 
-        new_comment = Comment(
-            content=content,
-            user_id=user_id,
-            post_id=post_id
-        )
-        db.session.add(new_comment)
         post = Post.query.get(post_id)
-        if post:
-            post.comments_count += 1
+        if not post:
+            return make_response(jsonify({'message': 'Post not found'}), 404)
+
+        parent = None
+        if parent_id is not None:
+            parent = Comment.query.filter_by(id=parent_id, post_id=post_id).first()
+            if not parent:
+                return make_response(jsonify({'message': 'Parent comment not found'}), 404)
+            if parent.depth + 1 >= comments.MAX_DEPTH:
+                return make_response(jsonify({'message': f'Bad Request: Replies can be at most {comments.MAX_DEPTH} levels deep'}), 400)
+
+        new_comment = comments.add(post.id, user_id, content, parent)
+        trending.refresh(post)
+        notify.publish('comment', user_id, {post.author_id, parent.user_id} if parent else [post.author_id], post.id)
         db.session.commit()
-        return make_response(jsonify({'message': 'Comment created successfully'}), 201)
+        return make_response(jsonify({'message': 'Comment created successfully', 'id': new_comment.id}), 201)
     
     def get(self, post_id):  
+        cursor = request.args.get('cursor')
+        after = comments.THREADS.decode(cursor) if cursor else None
+        replies = max(0, min(request.args.get('replies', comments.DEFAULT_REPLIES, type=int), comments.MAX_REPLIES))
 
         try:
-            comments = Comment.query.filter_by(post_id=post_id).all()
-            comments_list = [{'id': c.id, 'content': c.content} for c in comments]
+            threads, next_cursor = comments.threads(post_id, page_limit(), after, replies)
+            total = PostStats.totals([post_id])[post_id]['comments_count']
             return jsonify({
-                'comments': comments_list,
-                'total': len(comments)
+                'comments': threads,
+                'total': total,
+                'next_cursor': next_cursor
             })
         except Exception as e:
             print(f"Error fetching comments: {e}")
             return {'message': 'Error fetching comments'}, 500
+
+class CommentReplies(Resource):
+    def get(self, post_id, id):
+        comment = Comment.query.filter_by(id=id, post_id=post_id).first()
+        if not comment:
+            return make_response(jsonify({'message': 'Comment not found'}), 404)
+
+        after_path = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            after_path, = decode_cursor(cursor, 1)
+            if not isinstance(after_path, str) or not after_path.startswith(comment.path):
+                return make_response(jsonify({'message': 'Bad Request: Invalid cursor'}), 400)
+
+        replies, next_cursor = comments.replies_page(comment, page_limit(), after_path)
+        return make_response(jsonify({'comments': replies, 'next_cursor': next_cursor}), 200)
         
 class MyComments(Resource):
     @jwt_required()
     def get(self):
         user_id = get_jwt_identity()
-        comments = Comment.query.filter_by(user_id=user_id).all()
-        comments_list = [{'id': c.id, 'content': c.content} for c in comments]
-        return jsonify({'comments': comments_list})
+        return jsonify({'comments': reads.user_comments(user_id)})
    
 api.add_resource(CommentResource, '/posts/<int:post_id>/comments/<int:id>')
 api.add_resource(CommentsListResource, '/posts/<int:post_id>/comments')
+api.add_resource(CommentReplies, '/posts/<int:post_id>/comments/<int:id>/replies')
 api.add_resource(MyComments, '/my-comments')
 
 # Messages Resources
+def send_message_response(recipient_id, data):
+    user_id = get_jwt_identity()
+    content = data.get('content') if data else None
+
+    if not content:
+        return make_response(jsonify({'message': 'Bad Request: Missing content'}), 400)
+    if not isinstance(recipient_id, int) or recipient_id == user_id:
+        return make_response(jsonify({'message': 'Bad Request: Invalid recipient'}), 400)
+    if not db.session.get(User, recipient_id):
+        return make_response(jsonify({'message': 'User not found'}), 404)
+
+    try:
+        message = conversations.send(user_id, recipient_id, content)
+        db.session.commit()
+        return make_response(jsonify({'message': 'Message sent successfully', 'id': message.id}), 201)
+    except Exception as e:
+        db.session.rollback()
+        return make_response(jsonify({'message': f'Error: {str(e)}'}), 500)
+
 class MessageResource(Resource):
     @jwt_required()
-    def post(self, recipient_id):
+    def post(self, id=None):
+        # POST /users/me/messages/<recipient id>, or the recipient_id in the body.
         data = request.get_json()
-        user_id = get_jwt_identity()
-        content = data.get('content')
-
-        if not content:
-            return make_response(jsonify({'message': 'Bad Request: Missing content'}), 400)
-
-        new_message = Messages(
-            content=content,
-            sender_id=user_id,
-            recipient_id=recipient_id
-        )
-        db.session.add(new_message)
-        db.session.commit()
-        return make_response(jsonify({'message': 'Message sent successfully'}), 201)
+        return send_message_response(id if id is not None else (data or {}).get('recipient_id'), data)
     
     @jwt_required()
     def get(self, id):
@@ -1252,7 +1409,7 @@ class MessageResource(Resource):
         if not content:
             return make_response(jsonify({'message': 'Bad Request: Missing content'}), 400)
         
-        message.content = content
+        message.set_content(content)
         db.session.commit()
         return make_response(jsonify({'message': 'Message updated successfully'}), 200)
     
@@ -1266,12 +1423,57 @@ class MessageResource(Resource):
             return make_response(jsonify({'message': 'Unauthorized'}), 403)
         
         db.session.delete(message)
+        if message.conversation_id:
+            conversations.removed(message)
         db.session.commit()
         return make_response(jsonify({'message': 'Message deleted successfully'}), 200)
 
+class ArchivedMessages(Resource):
+    @jwt_required()
+    def get(self):
+        return archive_response('message')
+
+class Inbox(Resource):
+    @jwt_required()
+    def get(self):
+        user_id = get_jwt_identity()
+        items, next_cursor = paginate(conversations.inbox_query(user_id), Keyset(Conversation.last_message_at, Conversation.id))
+        return make_response(jsonify({'data': conversations.serialize_inbox(user_id, items), 'next_cursor': next_cursor}), 200)
+
+class ConversationMessages(Resource):
+    @jwt_required()
+    def get(self, other_id):
+        before = request.args.get('before', type=int)
+        after = request.args.get('after', type=int)
+        if ('before' in request.args and before is None) or ('after' in request.args and after is None):
+            return make_response(jsonify({'message': 'Bad Request: before and after must be message ids'}), 400)
+        if before is not None and after is not None:
+            return make_response(jsonify({'message': 'Bad Request: Use either before or after'}), 400)
+
+        user_id = get_jwt_identity()
+        if not db.session.get(User, other_id):
+            return make_response(jsonify({'message': 'User not found'}), 404)
+
+        conversation = conversations.find(user_id, other_id)
+        if not conversation:
+            return make_response(jsonify({'data': [], 'next_cursor': None}), 200)
+
+        messages, next_id = conversations.thread(conversation.id, page_limit(), before, after)
+        return make_response(jsonify({'data': serialize_messages(messages), 'next_cursor': next_id}), 200)
+
+    @jwt_required()
+    def post(self, other_id):
+        return send_message_response(other_id, request.get_json())
+
 api.add_resource(MessageResource, '/users/me/messages/<int:id>', '/users/me/messages')
+api.add_resource(Inbox, '/users/me/conversations')
+api.add_resource(ConversationMessages, '/users/me/conversations/<int:other_id>/messages')
+api.add_resource(ArchivedMessages, '/users/me/messages/archive')
 
 def is_admin(user_id):
+    principal = current_principal()
+    if principal.id == user_id:
+        return principal.is_admin
     user = User.query.filter_by(id=user_id).first()
     return user.is_admin if user else False
 
@@ -1341,15 +1543,46 @@ class TagResource(Resource):
 
 class TagListResource(Resource):
     def get(self):
-        tags = Tag.query.all()
-        result = [tag.to_dict() for tag in tags]
-        return make_response(jsonify(result), 200)
+        etag, last_modified = validators('tags', *collection_versions('tags')[0])
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
+        response = paginated_response(reads.tags_query(), Keyset(Tag.id, descending=False), reads.as_dicts)
+        return with_validators(response, etag, last_modified)
     
 
 
 api.add_resource(TagResource, '/tags/<int:id>')
 api.add_resource(TagListResource, '/tags')
 
+# Search Resources
+class SearchResource(Resource):
+    def get(self):
+        q = request.args.get('q', '').strip()
+        if not q:
+            return make_response(jsonify({'message': 'Bad Request: Missing q'}), 400)
+
+        kinds = search.KINDS
+        if request.args.get('type'):
+            kinds = [kind for kind in request.args['type'].split(',') if kind in search.KINDS]
+            if not kinds:
+                return make_response(jsonify({'message': f'Bad Request: type must be one of {", ".join(search.KINDS)}'}), 400)
+
+        after = None
+        if request.args.get('cursor'):
+            after = decode_cursor(request.args['cursor'], 2)
+            if not all(isinstance(value, (int, float)) for value in after):
+                return make_response(jsonify({'message': 'Bad Request: Invalid cursor'}), 400)
+
+        if not search.available():
+            return make_response(jsonify({'message': 'Search is not supported on this database'}), 501)
+
+        results, next_cursor = search.find(q, kinds, page_limit(), after)
+        return make_response(jsonify({'data': results, 'next_cursor': next_cursor}), 200)
+
+api.add_resource(SearchResource, '/search')
+
 # Attachment Resources
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -1460,5 +1693,49 @@ class PostAttachmentsResource(Resource):
 
 api.add_resource(PostAttachmentsResource, '/posts/<int:post_id>/attachments')
 
+# Batch Resource
+class BatchResource(Resource):
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        items = data.get('requests')
+        error = batch.validate(items)
+        if error:
+            return make_response(jsonify({'message': error}), 400)
+
+        headers = {}
+        if request.headers.get('Authorization'):
+            headers['Authorization'] = request.headers['Authorization']
+        responses = batch.run(app, items, headers)
+        return make_response(jsonify({'responses': responses}), 200)
+
+api.add_resource(BatchResource, '/batch')
+
+# Event Stream Resource
+class StreamResource(Resource):
+    # EventSource can't send headers, so the token may also come as ?jwt=.
+    @jwt_required(locations=['headers', 'query_string'])
+    def get(self):
+        user_id = get_jwt_identity()
+        position = stream.decode_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+        if position is None:
+            cursor = stream.latest_cursor(user_id)
+            position = cursor, dict(cursor)
+        cursor, floor = position
+
+        broker = stream.broker()
+        wakeups = broker.subscribe(user_id)
+        if wakeups is None:
+            response = make_response(jsonify({'message': 'Too many open streams, try again shortly'}), 503)
+            response.headers['Retry-After'] = str(stream.RETRY_MILLISECONDS // 1000)
+            return response
+
+        response = Response(stream_with_context(stream.events(user_id, cursor, floor, wakeups)), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.call_on_close(lambda: broker.unsubscribe(user_id, wakeups))
+        return response
+
+api.add_resource(StreamResource, '/stream')
+
 if __name__ == '__main__':
     app.run(port=5555, debug=True)
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from backend.models import db
+
+MAX_BATCH_REQUESTS = 20
+BATCH_WORKERS = 4
+METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+# Responses that never end, or only once the whole table has been written;
+# their bodies can't be folded into a batch.
+STREAMING_PATHS = {'/stream'}
+
+# Shared by every batch in the worker process so concurrent batches can't
+# start more than BATCH_WORKERS threads between them.
+executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+
+
+def validate(items):
+    if not isinstance(items, list) or not items:
+        return 'Bad Request: Missing requests'
+    if len(items) > MAX_BATCH_REQUESTS:
+        return f'Bad Request: At most {MAX_BATCH_REQUESTS} requests per batch'
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str) or not item['path'].startswith('/'):
+            return 'Bad Request: Each request needs a path starting with /'
+        method = item.get('method', 'GET')
+        if not isinstance(method, str) or method.upper() not in METHODS:
+            return f'Bad Request: method must be one of {", ".join(sorted(METHODS))}'
+        headers = item.get('headers')
+        if headers is not None and (
+            not isinstance(headers, dict)
+            or not all(isinstance(name, str) and isinstance(value, str) for name, value in headers.items())
+        ):
+            return 'Bad Request: headers must be an object of strings'
+        if item.get('body') is not None and not isinstance(item['body'], dict):
+            return 'Bad Request: body must be an object or null'
+        path, _, query_string = item['path'].partition('?')
+        if path.rstrip('/') == '/batch':
+            return 'Bad Request: Batches cannot be nested'
+        if path.rstrip('/') in STREAMING_PATHS or 'stream' in parse_qs(query_string):
+            return 'Bad Request: Streaming requests cannot be batched'
+    return None
+
+
+def dispatch(app, item, headers):
+    # Runs one sub-request through the normal Flask dispatch (URL routing,
+    # JWT checks, Flask-RESTful resources) without a network round trip.
+    method = item.get('method', 'GET').upper()
+    request_headers = dict(headers)
+    request_headers.update(item.get('headers') or {})
+    path, _, query_string = item['path'].partition('?')
+
+    with app.test_request_context(
+        path,
+        method=method,
+        query_string=query_string,
+        headers=request_headers,
+        json=item.get('body')
+    ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            db.session.rollback()
+            return {'status': 500, 'body': {'message': f'Error: {str(e)}'}}
+
+        # e.g. NDJSON picked through the Accept header.
+        if response.is_streamed:
+            response.close()
+            return {'status': 400, 'body': {'message': 'Bad Request: Streaming requests cannot be batched'}}
+
+        body = response.get_json(silent=True)
+        if body is None:
+            body = response.get_data(as_text=True)
+        result = {'status': response.status_code, 'body': body}
+        if response.headers.get('ETag'):
+            result['headers'] = {'ETag': response.headers['ETag']}
+        return result
+
+
+def run(app, items, headers):
+    # A batch of only GETs has no ordering constraints, so its sub-requests
+    # run on the pool, each in its own app context and session. Anything
+    # that writes runs in order in the caller's context and session, so
+    # later sub-requests see earlier writes.
+    if all(item.get('method', 'GET').upper() == 'GET' for item in items):
+        return list(executor.map(lambda item: dispatch(app, item, headers), items))
+    return [dispatch(app, item, headers) for item in items]
@@ -0,0 +1,49 @@
+# Login throughput of the password hashing pool in passwords.py. Submits
+# password checks the way concurrent logins would and reports logins/sec in
+# total and per core, next to checking inline in a single thread:
+#
+#   python -m backend.benchmark_passwords [logins] [workers]
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from werkzeug.security import generate_password_hash, check_password_hash
+from backend import passwords
+
+
+def main(logins=64, workers=os.cpu_count()):
+    app = Flask(__name__)
+    app.config.update(
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_MAX_PENDING=logins,
+        PASSWORD_HASH_TIMEOUT=600
+    )
+    password_hash = generate_password_hash('correct horse battery staple', method=passwords.HASH_METHOD)
+
+    start = time.perf_counter()
+    for _ in range(max(1, logins // 8)):
+        check_password_hash(password_hash, 'correct horse battery staple')
+    inline = max(1, logins // 8) / (time.perf_counter() - start)
+
+    def login():
+        with app.app_context():
+            return passwords.verify_password(password_hash, 'correct horse battery staple')
+
+    with app.app_context():
+        passwords.hash_password('warm up the pool')
+    with ThreadPoolExecutor(max_workers=logins) as clients:
+        start = time.perf_counter()
+        results = list(clients.map(lambda _: login(), range(logins)))
+        pooled = logins / (time.perf_counter() - start)
+    assert all(matches for matches, _ in results)
+    passwords.reset()
+
+    cores = min(workers, os.cpu_count())
+    print(f'{passwords.HASH_METHOD}, {logins} logins, {workers} hashing processes on {cores} cores')
+    print(f'inline, 1 thread:  {inline:8.1f} logins/sec')
+    print(f'pool:              {pooled:8.1f} logins/sec, {pooled / cores:.1f} per core')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,103 @@
+# Micro-benchmark for the row based read path in reads.py against the ORM +
+# to_dict path it replaced. Runs against a throwaway SQLite database:
+#
+#   python -m backend.benchmark_reads [rows] [repeat]
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+os.environ['DATABASE_URI'] = 'sqlite:///' + database.name
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+
+from backend.app import app
+from backend.models import db, User, Post, Category, Tag, Comment, PostStats, serialize_posts, make_excerpt
+from backend import reads, trending
+
+
+def populate(rows):
+    users = [
+        User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x', followers_count=i % 97, following_count=0)
+        for i in range(rows)
+    ]
+    categories = [Category(name=f'category{i}') for i in range(rows)]
+    tags = [Tag(name=f'tag{i}') for i in range(rows)]
+    db.session.add_all(users + categories + tags)
+    db.session.flush()
+
+    posts = []
+    for i in range(rows):
+        content = f'post {i} ' * 50
+        posts.append(Post(
+            title=f'Post {i}',
+            content=content,
+            excerpt=make_excerpt(content),
+            author_id=users[i].id,
+            category_id=categories[i].id,
+            tags=tags[i:i + 3]
+        ))
+    db.session.add_all(posts)
+    db.session.flush()
+    for post in posts:
+        PostStats.create_shards(post.id)
+        trending.track(post)
+    db.session.add_all([Comment(content=f'comment {i}', post_id=posts[i].id, user_id=users[0].id) for i in range(rows)])
+    db.session.commit()
+    return users[0].id
+
+
+def orm_paths(user_id, rows):
+    return {
+        'RecommendedUsers': lambda: [user.to_dict() for user in User.query.filter_by(is_admin=False).order_by(User.followers_count.desc()).limit(rows).all()],
+        'PopularPosts': lambda: serialize_posts(trending.top_posts(limit=trending.MAX_LIMIT)),
+        'Categories': lambda: [category.to_dict() for category in Category.query.all()],
+        'TagListResource': lambda: [tag.to_dict() for tag in Tag.query.order_by(Tag.id).all()],
+        'MyComments': lambda: [{'id': c.id, 'content': c.content} for c in Comment.query.filter_by(user_id=user_id).all()],
+    }
+
+
+def row_paths(user_id, rows):
+    return {
+        'RecommendedUsers': lambda: reads.recommended_users(limit=rows),
+        'PopularPosts': lambda: reads.popular_posts(limit=trending.MAX_LIMIT),
+        'Categories': reads.categories,
+        'TagListResource': lambda: reads.as_dicts(reads.tags_query().order_by(Tag.id).all()),
+        'MyComments': lambda: reads.user_comments(user_id),
+    }
+
+
+def canonical(result):
+    return sorted(json.dumps(item, sort_keys=True, default=str) for item in result)
+
+
+def measure(path, repeat):
+    def run():
+        path()
+        # Each request gets a fresh session, so don't let the identity map
+        # carry objects over between runs.
+        db.session.remove()
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main(rows=2000, repeat=20):
+    with app.app_context():
+        db.create_all()
+        user_id = populate(rows)
+        orm, core = orm_paths(user_id, rows), row_paths(user_id, rows)
+
+        print(f'{rows} rows per table, best of {repeat}')
+        print(f'{"endpoint":<18}{"to_dict ms":>12}{"rows ms":>10}{"speedup":>10}')
+        for name in orm:
+            assert canonical(orm[name]()) == canonical(core[name]()), name
+            db.session.remove()
+            orm_time, core_time = measure(orm[name], repeat), measure(core[name], repeat)
+            print(f'{name:<18}{orm_time * 1000:>12.2f}{core_time * 1000:>10.2f}{orm_time / core_time:>9.1f}x')
+
+        db.drop_all()
+    os.remove(database.name)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+from flask import request, make_response
+from sqlalchemy import event, update, insert
+from sqlalchemy.orm import Session
+from backend.models import Category, Tag, CollectionVersion
+
+# Collections whose list endpoints are validated by a version counter instead
+# of per-row timestamps. The counter is bumped in the same transaction as
+# any insert, update or delete of the mapped model.
+COLLECTIONS = {
+    Category: 'categories',
+    Tag: 'tags',
+}
+
+
+def collection_versions(*names):
+    rows = CollectionVersion.query.filter(CollectionVersion.name.in_(names)).all()
+    found = {row.name: (row.version, row.updated_at) for row in rows}
+    return [found.get(name, (0, None)) for name in names]
+
+
+def validators(*parts):
+    # Builds an (etag, last_modified) pair from version numbers and
+    # timestamps. Timestamps are naive local times as stored by the models.
+    timestamps = [part for part in parts if isinstance(part, datetime)]
+    tag = '-'.join(str(int(part.timestamp() * 1000000)) if isinstance(part, datetime) else str(part) for part in parts)
+    last_modified = max(timestamps).astimezone(timezone.utc) if timestamps else None
+    return tag, last_modified
+
+
+def with_validators(response, etag, last_modified=None):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matched = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        matched = False
+
+    if matched:
+        return with_validators(make_response('', 304), etag, last_modified)
+    return None
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_collection_versions(session, flush_context):
+    names = {
+        COLLECTIONS[type(obj)]
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if type(obj) in COLLECTIONS and (obj not in session.dirty or session.is_modified(obj))
+    }
+    if not names:
+        return
+
+    connection = session.connection()
+    now = datetime.now()
+    table = CollectionVersion.__table__
+    for name in sorted(names):
+        result = connection.execute(
+            update(table).where(table.c.name == name).values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(name=name, version=1, updated_at=now))
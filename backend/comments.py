@@ -0,0 +1,137 @@
+from sqlalchemy import select, update, delete, func, and_
+from backend.models import db, Comment, User, PostStats
+from backend.pagination import Keyset, encode_cursor
+from backend import search
+
+# Threaded comments. Each comment stores its materialized path, the zero
+# padded ids of the top-level comment down to itself ("0000000012/0000000045/"),
+# so within a thread (thread_id = the top-level comment) sorting by path gives
+# replies in conversation order and the replies below any comment are one
+# range on idx_comments_thread_id_path. reply_count on every comment and the
+# post's comments_count move with each insert and delete.
+MAX_DEPTH = 20
+DEFAULT_REPLIES = 3
+MAX_REPLIES = 20
+
+THREADS = Keyset(Comment.id, descending=False)
+
+
+def segment(comment_id):
+    return f'{comment_id:010d}/'
+
+
+def ancestor_ids(path):
+    return [int(part) for part in path.split('/') if part]
+
+
+def below(path):
+    # Strictly below path: '/' sorts right before '0', so every descendant
+    # path is between path and path with its last '/' bumped to '0'.
+    return and_(Comment.path > path, Comment.path < path[:-1] + '0')
+
+
+def add(post_id, user_id, content, parent=None):
+    # The caller commits.
+    comment = Comment(
+        post_id=post_id,
+        user_id=user_id,
+        content=content,
+        parent_id=parent.id if parent else None,
+        depth=parent.depth + 1 if parent else 0
+    )
+    db.session.add(comment)
+    db.session.flush()
+    comment.path = (parent.path if parent else '') + segment(comment.id)
+    comment.thread_id = parent.thread_id if parent else comment.id
+
+    if parent:
+        db.session.execute(
+            update(Comment).where(Comment.id.in_(ancestor_ids(parent.path)))
+            .values(reply_count=Comment.reply_count + 1)
+        )
+    PostStats.increment(post_id, comments_count=1)
+    return comment
+
+
+def remove(comment):
+    # Takes the replies below comment with it. The caller commits.
+    removed = 1 + comment.reply_count
+    reply_ids = db.session.scalars(
+        delete(Comment).where(Comment.thread_id == comment.thread_id, below(comment.path))
+        .returning(Comment.id),
+        execution_options={'synchronize_session': False}
+    ).all()
+    search.unindex('comment', reply_ids)
+    ancestors = ancestor_ids(comment.path)[:-1]
+    if ancestors:
+        db.session.execute(
+            update(Comment).where(Comment.id.in_(ancestors))
+            .values(reply_count=Comment.reply_count - removed)
+        )
+    db.session.delete(comment)
+    PostStats.increment(comment.post_id, comments_count=-removed)
+
+
+def with_author(query):
+    return query.add_columns(User.username, User.profile_pic).join(User, User.id == Comment.user_id)
+
+
+def serialize(row):
+    comment, username, profile_pic = row
+    result = comment.to_dict()
+    result['author'] = {'id': comment.user_id, 'username': username, 'profile_pic': profile_pic}
+    return result
+
+
+def threads(post_id, limit, after=None, replies=DEFAULT_REPLIES):
+    # One query: a page of top-level comments, oldest first, each with the
+    # first `replies` comments of its thread in path order. Returns (threads,
+    # next cursor or None); a thread with more replies than it came with has
+    # a replies_cursor for replies_page().
+    roots = select(Comment.id).where(Comment.post_id == post_id, Comment.depth == 0)
+    if after is not None:
+        roots = roots.where(THREADS.after(after))
+    roots = roots.order_by(*THREADS.order_by()).limit(limit + 1)
+
+    position = func.row_number().over(partition_by=Comment.thread_id, order_by=Comment.path)
+    ranked = select(Comment.id, position.label('position')).where(Comment.thread_id.in_(roots)).subquery()
+    rows = db.session.execute(
+        with_author(select(Comment))
+        .join(ranked, ranked.c.id == Comment.id)
+        .where(ranked.c.position <= replies + 1)
+        .order_by(Comment.thread_id, Comment.path)
+    ).all()
+
+    result, last = [], {}
+    for row in rows:
+        comment = row[0]
+        if comment.depth == 0:
+            result.append(serialize(row))
+            result[-1]['replies'] = []
+            last[comment.id] = comment.path
+        elif result and result[-1]['id'] == comment.thread_id:
+            result[-1]['replies'].append(serialize(row))
+            last[comment.thread_id] = comment.path
+
+    next_cursor = None
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = encode_cursor([result[-1]['id']])
+    for thread in result:
+        more = thread['reply_count'] > len(thread['replies'])
+        thread['replies_cursor'] = encode_cursor([last[thread['id']]]) if more else None
+    return result, next_cursor
+
+
+def replies_page(comment, limit, after_path=None):
+    # Replies below comment in path order, after the reply at after_path.
+    query = with_author(select(Comment)).where(Comment.thread_id == comment.thread_id, below(comment.path))
+    if after_path is not None:
+        query = query.where(Comment.path > after_path)
+    rows = db.session.execute(query.order_by(Comment.path).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][0].path])
+    return [serialize(row) for row in rows], next_cursor
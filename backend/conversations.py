@@ -0,0 +1,110 @@
+from sqlalchemy import select, update, delete, func, or_
+from backend.models import db, Conversation, Messages, User, serialize_messages
+from backend.ratings import UPSERTS
+
+# Direct messages are grouped into conversations keyed by the unordered pair
+# of users. The conversations row is kept up to date as messages are sent
+# and deleted, so the inbox is a keyset scan over the user's conversations
+# and a thread is a range scan on messages(conversation_id, id).
+
+
+def pair(user_id, other_id):
+    return (user_id, other_id) if user_id < other_id else (other_id, user_id)
+
+
+def find(user_id, other_id):
+    low, high = pair(user_id, other_id)
+    return Conversation.query.filter_by(user_low_id=low, user_high_id=high).first()
+
+
+def send(sender_id, recipient_id, content):
+    # The caller commits.
+    low, high = pair(sender_id, recipient_id)
+    table = Conversation.__table__
+    now = func.current_timestamp()
+    insert = UPSERTS[db.session.get_bind().dialect.name]
+    statement = insert(table).values(user_low_id=low, user_high_id=high, created_at=now, last_message_at=now)
+    conversation_id = db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['user_low_id', 'user_high_id'],
+            set_={'last_message_at': now}
+        ).returning(table.c.id)
+    ).scalar()
+
+    message = Messages(sender_id=sender_id, recipient_id=recipient_id, conversation_id=conversation_id)
+    message.set_content(content)
+    db.session.add(message)
+    db.session.flush()
+
+    # Two sends racing on the same conversation: the higher id wins.
+    db.session.execute(update(table).where(
+        table.c.id == conversation_id,
+        or_(table.c.last_message_id.is_(None), table.c.last_message_id < message.id)
+    ).values(last_message_id=message.id, last_sender_id=sender_id))
+    return message
+
+
+def removed(message):
+    # Call after deleting message. Points its conversation at the newest
+    # message left, or drops the conversation once it is empty.
+    table = Conversation.__table__
+    latest = db.session.execute(
+        select(Messages.id, Messages.sender_id, Messages.created_at)
+        .where(Messages.conversation_id == message.conversation_id)
+        .order_by(Messages.id.desc())
+        .limit(1)
+    ).first()
+    if latest is None:
+        db.session.execute(delete(table).where(table.c.id == message.conversation_id))
+        return
+    db.session.execute(update(table).where(
+        table.c.id == message.conversation_id,
+        table.c.last_message_id == message.id
+    ).values(last_message_id=latest.id, last_sender_id=latest.sender_id, last_message_at=latest.created_at))
+
+
+def inbox_query(user_id):
+    return Conversation.query.filter(or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id))
+
+
+def serialize_inbox(user_id, conversations):
+    # Two queries for the whole page: the other participants and the latest
+    # messages. A latest message that has been archived comes back as None.
+    other_ids = {conversation.other_id(user_id) for conversation in conversations}
+    users = {
+        row.id: row._asdict()
+        for row in db.session.execute(
+            select(User.id, User.username, User.profile_pic).where(User.id.in_(other_ids))
+        )
+    }
+    last_ids = [conversation.last_message_id for conversation in conversations if conversation.last_message_id]
+    latest = Messages.query.filter(Messages.id.in_(last_ids)).all()
+    messages = {message['id']: message for message in serialize_messages(latest)}
+
+    result = []
+    for conversation in conversations:
+        result.append({
+            'id': conversation.id,
+            'user': users.get(conversation.other_id(user_id)),
+            'last_message': messages.get(conversation.last_message_id),
+            'last_message_at': conversation.last_message_at
+        })
+    return result
+
+
+def thread(conversation_id, limit, before=None, after=None):
+    # Newest first. before pages back in time and after forward; returns
+    # (messages, next id to pass as the same parameter, or None).
+    query = Messages.query.filter(Messages.conversation_id == conversation_id)
+    if after is not None:
+        rows = query.filter(Messages.id > after).order_by(Messages.id.asc()).limit(limit + 1).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return rows[::-1], (rows[-1].id if more else None)
+
+    if before is not None:
+        query = query.filter(Messages.id < before)
+    rows = query.order_by(Messages.id.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if more else None)
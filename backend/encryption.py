@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from flask import current_app
+
+# Message encryption. MESSAGE_ENCRYPTION_KEYS is a comma separated list of
+# Fernet keys, newest first: new messages are encrypted with the first and
+# any of them decrypts. To rotate, put a new key in front, deploy, run
+#
+#   python -m backend.rekey
+#
+# to re-encrypt stored messages with it, then drop the old key.
+#
+# Without any keys the app refuses to start: a key generated per process
+# can't read what other workers wrote, or anything after a restart. Debug
+# and testing apps, or MESSAGE_ENCRYPTION_EPHEMERAL_KEY, opt into one anyway.
+DECRYPT_WORKERS = 4
+DECRYPT_CACHE_SIZE = 4096
+PARALLEL_THRESHOLD = 32
+
+# Shared by every request in the worker process, like batch.executor.
+executor = ThreadPoolExecutor(max_workers=DECRYPT_WORKERS, thread_name_prefix='decrypt')
+
+
+class KeyRing:
+    def __init__(self, keys, logger):
+        self.primary = Fernet(keys[0])
+        self.fernet = MultiFernet([Fernet(key) for key in keys])
+        self.logger = logger
+        # A ciphertext always decrypts to the same plaintext, so recently
+        # read ones (the top of a thread, the inbox) are kept by ciphertext.
+        self.decrypt = lru_cache(maxsize=DECRYPT_CACHE_SIZE)(self.decrypt_uncached)
+
+    def encrypt(self, plaintext):
+        return self.fernet.encrypt(plaintext.encode()).decode()
+
+    def decrypt_uncached(self, token):
+        # None for content no key in the ring can read, e.g. messages written
+        # under the old per-process keys, so one bad row doesn't fail a page.
+        try:
+            return self.fernet.decrypt(token.encode()).decode()
+        except InvalidToken:
+            self.logger.warning('Message content could not be decrypted with any key in MESSAGE_ENCRYPTION_KEYS')
+            return None
+
+    def decrypt_many(self, tokens):
+        # A page of messages: split across the pool when it is big enough to
+        # be worth the hand-off, in order.
+        tokens = list(tokens)
+        if len(tokens) < PARALLEL_THRESHOLD:
+            return [self.decrypt(token) for token in tokens]
+        size = -(-len(tokens) // DECRYPT_WORKERS)
+        parts = [tokens[start:start + size] for start in range(0, len(tokens), size)]
+        return [plaintext for part in executor.map(lambda part: [self.decrypt(token) for token in part], parts) for plaintext in part]
+
+    def is_current(self, token):
+        try:
+            self.primary.decrypt(token.encode())
+        except InvalidToken:
+            return False
+        return True
+
+    def rotate(self, token):
+        # None when no key in the ring can read token.
+        try:
+            return self.fernet.rotate(token.encode()).decode()
+        except InvalidToken:
+            return None
+
+
+ring_lock = threading.Lock()
+MISSING_KEYS = 'MESSAGE_ENCRYPTION_KEYS is not set (set MESSAGE_ENCRYPTION_EPHEMERAL_KEY=1 to use a throwaway key in development)'
+
+
+def parse_keys(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    return [key.strip() for key in value or () if key and key.strip()]
+
+
+def ephemeral_allowed(app):
+    return app.debug or app.testing or bool(app.config.get('MESSAGE_ENCRYPTION_EPHEMERAL_KEY'))
+
+
+def check_keys(app):
+    # Called at startup so a missing key fails the deploy rather than the
+    # messages written afterwards.
+    if not parse_keys(app.config.get('MESSAGE_ENCRYPTION_KEYS')) and not ephemeral_allowed(app):
+        raise RuntimeError(MISSING_KEYS)
+
+
+def key_ring():
+    app = current_app._get_current_object()
+    if 'message_keys' not in app.extensions:
+        with ring_lock:
+            if 'message_keys' not in app.extensions:
+                keys = parse_keys(app.config.get('MESSAGE_ENCRYPTION_KEYS'))
+                if not keys:
+                    if not ephemeral_allowed(app):
+                        raise RuntimeError(MISSING_KEYS)
+                    app.logger.warning(
+                        'MESSAGE_ENCRYPTION_KEYS is not set; messages are encrypted with a key that only lasts as long as this process'
+                    )
+                    keys = [Fernet.generate_key()]
+                app.extensions['message_keys'] = KeyRing(keys, app.logger)
+    return app.extensions['message_keys']
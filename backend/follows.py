@@ -0,0 +1,62 @@
+from datetime import datetime
+from sqlalchemy import update, delete, func, literal
+from backend.models import db, User, followers
+from backend.ratings import UPSERTS
+from backend import timeline, recommendations, notify
+
+MAX_BULK_FOLLOWS = 100
+
+
+def adjust_counts(user_id, changed_ids, sign):
+    # Counters move by exactly the number of follow rows that changed, in the
+    # same transaction as the change, so a failure can't leave them off.
+    # Returns (id, new followers_count) for changed_ids.
+    if not changed_ids:
+        return []
+    db.session.execute(update(User).where(User.id == user_id).values(
+        following_count=func.coalesce(User.following_count, 0) + sign * len(changed_ids)
+    ))
+    return db.session.execute(update(User).where(User.id.in_(changed_ids)).values(
+        followers_count=func.coalesce(User.followers_count, 0) + sign
+    ).returning(User.id, User.followers_count)).all()
+
+
+def follow(user_id, followed_ids):
+    # INSERT ... SELECT FROM users ... ON CONFLICT DO NOTHING: unknown ids,
+    # the user themself and users already followed produce no row. Returns
+    # the ids that were newly followed. The caller commits.
+    rows = db.session.query(
+        literal(user_id),
+        User.id,
+        literal(datetime.now())
+    ).filter(User.id.in_(list(followed_ids)), User.id != user_id)
+
+    insert = UPSERTS[db.session.get_bind().dialect.name]
+    statement = insert(followers).from_select(['follower_id', 'followed_id', 'created_at'], rows.statement)
+    statement = statement.on_conflict_do_nothing().returning(followers.c.followed_id)
+    added = [followed_id for followed_id, in db.session.execute(statement)]
+
+    adjust_counts(user_id, added, 1)
+    for followed_id in added:
+        timeline.backfill(user_id, followed_id)
+    if added:
+        recommendations.followed(user_id, added)
+        notify.publish('follow', user_id, added)
+    return added
+
+
+def unfollow(user_id, followed_ids):
+    removed = [followed_id for followed_id, in db.session.execute(
+        delete(followers).where(
+            followers.c.follower_id == user_id,
+            followers.c.followed_id.in_(list(followed_ids))
+        ).returning(followers.c.followed_id)
+    )]
+
+    for followed_id, followers_count in adjust_counts(user_id, removed, -1):
+        timeline.prune(user_id, followed_id)
+        if followers_count == timeline.FANOUT_FOLLOWER_LIMIT:
+            timeline.refill(followed_id)
+    if removed:
+        recommendations.unfollowed(user_id, removed)
+    return removed
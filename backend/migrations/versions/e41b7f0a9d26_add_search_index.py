@@ -0,0 +1,64 @@
+"""Add search_index
+
+Revision ID: e41b7f0a9d26
+Revises: 5c8d2e61f4a7
+Create Date: 2026-10-18 12:02:17.630455
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41b7f0a9d26'
+down_revision = '5c8d2e61f4a7'
+branch_labels = None
+depends_on = None
+
+# Document ids are ref_id * 4 + kind, kinds in the order of backend.search.KINDS.
+SOURCES = [
+    ("post", 0, "id", "title", "content", "posts"),
+    ("comment", 1, "id", "''", "content", "comments"),
+    ("user", 2, "id", "username", "''", "users"),
+    ("tag", 3, "id", "name", "''", "tags"),
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, title, body, tokenize = 'porter unicode61')"
+        )
+        for kind, code, id_column, title, body, table in SOURCES:
+            op.execute(
+                f"INSERT INTO search_index (rowid, kind, ref_id, title, body) "
+                f"SELECT {id_column} * 4 + {code}, '{kind}', {id_column}, {title}, {body} FROM {table}"
+            )
+    elif dialect == 'postgresql':
+        op.create_table('search_index',
+        sa.Column('doc_id', sa.BigInteger(), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('ref_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.Text(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('document', sa.dialects.postgresql.TSVECTOR(), nullable=False),
+        sa.PrimaryKeyConstraint('doc_id', name=op.f('pk_search_index'))
+        )
+        for kind, code, id_column, title, body, table in SOURCES:
+            op.execute(
+                f"INSERT INTO search_index (doc_id, kind, ref_id, title, body, document) "
+                f"SELECT {id_column} * 4 + {code}, '{kind}', {id_column}, {title}, {body}, "
+                f"setweight(to_tsvector('english', {title}), 'A') || setweight(to_tsvector('english', {body}), 'B') "
+                f"FROM {table}"
+            )
+        op.create_index('idx_search_index_document', 'search_index', ['document'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('idx_search_index_document', table_name='search_index', postgresql_using='gin')
+    if dialect in ('sqlite', 'postgresql'):
+        op.drop_table('search_index')
@@ -1,16 +1,16 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, func, update
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from cryptography.fernet import Fernet
+from backend.passwords import verify_password
+from backend.encryption import key_ring
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.types import JSON
 from enum import Enum
 from sqlalchemy import Enum as SqlEnum
-
-key = Fernet.generate_key()
-cipher_suite = Fernet(key)
+from sqlalchemy.orm.attributes import set_committed_value
+from collections import defaultdict
+import random
 
 metadata = MetaData(
     naming_convention={
@@ -28,7 +28,9 @@ followers = db.Table('followers',
     db.Column('follower_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('followed_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('created_at', db.DateTime, default=datetime.now),
-    db.UniqueConstraint('follower_id', 'followed_id', name='uix_follower_followed')
+    db.UniqueConstraint('follower_id', 'followed_id', name='uix_follower_followed'),
+    db.Index('idx_followers_followed_id_created_at', 'followed_id', 'created_at'),
+    db.Index('idx_followers_follower_id_created_at', 'follower_id', 'created_at')
 )
 
 class User(db.Model):
@@ -41,6 +43,8 @@ class User(db.Model):
     followers_count = db.Column(db.Integer, default=0)
     following_count = db.Column(db.Integer, default=0)
     is_admin = db.Column(db.Boolean, default=False)
+    # Carried in every token; bumping it invalidates all of the user's tokens.
+    token_version = db.Column(db.Integer, nullable=False, default=0)
 
     user_profile = db.relationship('UserProfile', uselist=False, back_populates='user')
     followers = db.relationship(
@@ -67,7 +71,8 @@ class User(db.Model):
         }   
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        matches, _ = verify_password(self.password_hash, password)
+        return matches
 
 class UserProfile(db.Model):
     __tablename__ = 'user_profiles'
@@ -89,6 +94,16 @@ class UserProfile(db.Model):
             'social_links': self.social_links
         }
     
+EXCERPT_LENGTH = 280
+
+def make_excerpt(content):
+    # Stored alongside the content so list views can show a preview without
+    # reading the whole Text column.
+    text = ' '.join((content or '').split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    return text[:EXCERPT_LENGTH].rsplit(' ', 1)[0] + '...'
+
 class Post(db.Model):
     __tablename__ = 'posts'
     id = db.Column(db.Integer, primary_key=True)
@@ -96,20 +111,30 @@ class Post(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
     title = db.Column(db.String(255), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    excerpt = db.Column(db.String(EXCERPT_LENGTH + 3))
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
-    likes_count = db.Column(db.Integer, default=0)
-    dislikes_count = db.Column(db.Integer, default=0)
-    comments_count = db.Column(db.Integer, default=0)
 
     user = db.relationship('User', backref=db.backref('posts', lazy=True))
     category = db.relationship('Category', backref=db.backref('posts', lazy=True))
     tags = db.relationship('Tag', secondary='post_tags', backref=db.backref('posts', lazy='dynamic'))
 
+    __table_args__ = (
+        db.Index('idx_posts_created_at_id', 'created_at', 'id'),
+        db.Index('idx_posts_author_id_created_at_id', 'author_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f'<Post {self.title}>'
+
+    @property
+    def stats(self):
+        if getattr(self, '_stats', None) is None:
+            self._stats = PostStats.totals([self.id])[self.id]
+        return self._stats
     
     def to_dict(self):
+        stats = self.stats
         return {
             'id': self.id,
             'author': self.user.username,
@@ -118,14 +143,133 @@ class Post(db.Model):
             'category_name': self.category.name,
             'title': self.title,
             'content': self.content,
-            'likes_count': self.likes_count,
-            'dislikes_count': self.dislikes_count,
-            'comments_count': self.comments_count,
+            'excerpt': self.excerpt,
+            'likes_count': stats['likes_count'],
+            'dislikes_count': stats['dislikes_count'],
+            'comments_count': stats['comments_count'],
             'created_at': self.created_at,
             'updated_at': self.updated_at,
             'tags': [tag.name for tag in self.tags] 
         }
 
+# Names accepted by ?fields= on post lists: the columns each one needs and
+# how to read it. Relationships and counters are batch loaded by
+# serialize_posts only when a field that needs them is requested.
+POST_FIELDS = {
+    'id': ([Post.id], lambda post: post.id),
+    'author': ([Post.author_id], lambda post: post.user.username),
+    'author_id': ([Post.author_id], lambda post: post.author_id),
+    'category_id': ([Post.category_id], lambda post: post.category_id),
+    'category_name': ([Post.category_id], lambda post: post.category.name),
+    'title': ([Post.title], lambda post: post.title),
+    'content': ([Post.content], lambda post: post.content),
+    'excerpt': ([Post.excerpt], lambda post: post.excerpt),
+    'likes_count': ([], lambda post: post.stats['likes_count']),
+    'dislikes_count': ([], lambda post: post.stats['dislikes_count']),
+    'comments_count': ([], lambda post: post.stats['comments_count']),
+    'created_at': ([Post.created_at], lambda post: post.created_at),
+    'updated_at': ([Post.updated_at], lambda post: post.updated_at),
+    'tags': ([], lambda post: [tag.name for tag in post.tags]),
+}
+
+def post_columns(fields):
+    # id and created_at are always loaded: they are the keyset for post lists.
+    columns = {Post.id.key: Post.id, Post.created_at.key: Post.created_at}
+    for name in fields:
+        for column in POST_FIELDS[name][0]:
+            columns[column.key] = column
+    return list(columns.values())
+
+POST_STATS_SHARDS = 8
+
+class PostStats(db.Model):
+    # Post counters split over POST_STATS_SHARDS rows per post. Writers bump a
+    # random shard with an atomic UPDATE so concurrent likes on a popular
+    # post don't queue on one row lock, and the posts row (and its
+    # updated_at) is never touched. Readers sum the shards.
+    __tablename__ = 'post_stats'
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    likes_count = db.Column(db.Integer, nullable=False, default=0)
+    dislikes_count = db.Column(db.Integer, nullable=False, default=0)
+    comments_count = db.Column(db.Integer, nullable=False, default=0)
+
+    COUNTERS = ('likes_count', 'dislikes_count', 'comments_count')
+
+    def __repr__(self):
+        return f'<PostStats post_id={self.post_id} shard={self.shard}>'
+
+    @classmethod
+    def create_shards(cls, post_id):
+        db.session.execute(cls.__table__.insert(), [
+            dict(post_id=post_id, shard=shard, **dict.fromkeys(cls.COUNTERS, 0))
+            for shard in range(POST_STATS_SHARDS)
+        ])
+
+    @classmethod
+    def increment(cls, post_id, **deltas):
+        table = cls.__table__
+        values = {name: table.c[name] + delta for name, delta in deltas.items() if delta}
+        if not values:
+            return
+
+        statement = update(table).where(
+            table.c.post_id == post_id,
+            table.c.shard == random.randrange(POST_STATS_SHARDS)
+        ).values(**values)
+        if db.session.execute(statement).rowcount == 0:
+            cls.create_shards(post_id)
+            db.session.execute(statement)
+
+    @classmethod
+    def totals(cls, post_ids):
+        totals = {post_id: dict.fromkeys(cls.COUNTERS, 0) for post_id in post_ids}
+        if not post_ids:
+            return totals
+
+        rows = db.session.query(
+            cls.post_id,
+            *(func.sum(getattr(cls, name)) for name in cls.COUNTERS)
+        ).filter(cls.post_id.in_(post_ids)).group_by(cls.post_id).all()
+        for post_id, *counts in rows:
+            totals[post_id] = {name: count or 0 for name, count in zip(cls.COUNTERS, counts)}
+        return totals
+
+    @classmethod
+    def remove(cls, post_id):
+        cls.query.filter_by(post_id=post_id).delete()
+
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline_entries'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_timeline_entries_user_id_created_at_post_id', 'user_id', 'created_at', 'post_id'),
+        db.Index('idx_timeline_entries_user_id_author_id', 'user_id', 'author_id'),
+    )
+
+    def __repr__(self):
+        return f'<TimelineEntry user_id={self.user_id} post_id={self.post_id}>'
+
+class TrendingScore(db.Model):
+    __tablename__ = 'trending_scores'
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    favourites_count = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('idx_trending_scores_score', 'score'),
+        db.Index('idx_trending_scores_category_id_score', 'category_id', 'score'),
+    )
+
+    def __repr__(self):
+        return f'<TrendingScore post_id={self.post_id} score={self.score}>'
+
 class Category(db.Model):
     __tablename__ = 'categories'
     id = db.Column(db.Integer, primary_key=True)
@@ -159,7 +303,46 @@ post_tags = db.Table('post_tags',
     db.Column('post_id', db.Integer, db.ForeignKey('posts.id'), primary_key=True),
     db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True)
 )
-    
+
+def serialize_posts(posts, fields=None):
+    # Loads authors, categories, tags and counters for the whole list in four
+    # queries instead of four per post, then reuses Post.to_dict. With a list
+    # of POST_FIELDS names only those fields are built and only what they
+    # need is loaded.
+    posts = list(posts)
+    if not posts:
+        return []
+
+    wanted = set(fields or POST_FIELDS)
+    post_ids = [post.id for post in posts]
+
+    if 'author' in wanted:
+        authors = {user.id: user for user in User.query.filter(User.id.in_({post.author_id for post in posts})).all()}
+        for post in posts:
+            set_committed_value(post, 'user', authors.get(post.author_id))
+
+    if 'category_name' in wanted:
+        categories = {category.id: category for category in Category.query.filter(Category.id.in_({post.category_id for post in posts})).all()}
+        for post in posts:
+            set_committed_value(post, 'category', categories.get(post.category_id))
+
+    if 'tags' in wanted:
+        tags = defaultdict(list)
+        rows = db.session.query(post_tags.c.post_id, Tag).join(Tag, Tag.id == post_tags.c.tag_id).filter(post_tags.c.post_id.in_(post_ids)).all()
+        for post_id, tag in rows:
+            tags[post_id].append(tag)
+        for post in posts:
+            set_committed_value(post, 'tags', tags[post.id])
+
+    if wanted & set(PostStats.COUNTERS):
+        stats = PostStats.totals(post_ids)
+        for post in posts:
+            post._stats = stats[post.id]
+
+    if fields is None:
+        return [post.to_dict() for post in posts]
+    return [{name: POST_FIELDS[name][1](post) for name in fields} for post in posts]
+
 class Attachment(db.Model):
     __tablename__ = 'attachments'
     id = db.Column(db.Integer, primary_key=True)
@@ -205,6 +388,14 @@ class Rating(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     status = db.Column(SqlEnum(RatingStatus), nullable=False)
+    # Status before the last write, filled in by the rating upsert so the
+    # counter delta is known without reading the row first.
+    previous_status = db.Column(SqlEnum(RatingStatus), nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_ratings_post_id_id', 'post_id', 'id'),
+        db.UniqueConstraint('post_id', 'user_id', name='uix_rating_post_user'),
+    )
 
     def __repr__(self):
         return f'<Rating {self.id}>'
@@ -244,9 +435,23 @@ class Comment(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # Threads; see comments.py. path is the ids from the top-level comment
+    # down to this one, so a thread sorted by path is in reply order and a
+    # subtree is a path range. reply_count counts all replies below.
+    parent_id = db.Column(db.Integer, db.ForeignKey('comments.id'))
+    thread_id = db.Column(db.Integer)
+    path = db.Column(db.String(255))
+    depth = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     post = db.relationship('Post', backref=db.backref('comments', lazy=True))
     user = db.relationship('User', backref=db.backref('comments', lazy=True))
+
+    __table_args__ = (
+        db.Index('idx_comments_post_id_id', 'post_id', 'id'),
+        db.Index('idx_comments_post_id_depth_id', 'post_id', 'depth', 'id'),
+        db.Index('idx_comments_thread_id_path', 'thread_id', 'path'),
+    )
     
     def __repr__(self):
         return f'<Comment {self.id}>'
@@ -257,7 +462,10 @@ class Comment(db.Model):
             'post_id': self.post_id,
             'user_id': self.user_id,
             'content': self.content,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'parent_id': self.parent_id,
+            'depth': self.depth,
+            'reply_count': self.reply_count
 
         }
     
@@ -268,15 +476,23 @@ class Messages(db.Model):
     recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'))
 
     sender = db.relationship('User', foreign_keys=[sender_id], backref=db.backref('sent_messages', lazy='dynamic'))
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref=db.backref('received_messages', lazy='dynamic'))
 
+    __table_args__ = (
+        db.Index('idx_messages_conversation_id_id', 'conversation_id', 'id'),
+        db.Index('idx_messages_sender_id_recipient_id_created_at', 'sender_id', 'recipient_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Message {self.id}>'
 
-    def to_dict(self):
-        decrypted_content = cipher_suite.decrypt(self.content.encode()).decode()
+    def to_dict(self, decrypted_content=None):
+        # content is None when the message can't be decrypted.
+        if decrypted_content is None:
+            decrypted_content = key_ring().decrypt(self.content)
         return {
             'id': self.id,
             'sender_id': self.sender_id,
@@ -286,19 +502,67 @@ class Messages(db.Model):
         }
 
     def encrypt_content(self, content):
-        self.content = cipher_suite.encrypt(content.encode()).decode()
+        self.content = key_ring().encrypt(content)
 
     def set_content(self, content):
         self.encrypt_content(content)
 
+def serialize_messages(messages):
+    # Decrypts the whole list in one go instead of row by row in to_dict.
+    contents = key_ring().decrypt_many(message.content for message in messages)
+    return [message.to_dict(content) for message, content in zip(messages, contents)]
+
+class Conversation(db.Model):
+    # One row per pair of users who have messaged, stored with the lower id
+    # first; see conversations.py. Keeps the latest message so the inbox
+    # doesn't have to group the messages table. last_message_id is not a
+    # foreign key since retention.py may archive that message.
+    __tablename__ = 'conversations'
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    last_message_id = db.Column(db.Integer)
+    last_sender_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    last_message_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uix_conversation_users'),
+        db.Index('idx_conversations_user_low_id_last_message_at_id', 'user_low_id', 'last_message_at', 'id'),
+        db.Index('idx_conversations_user_high_id_last_message_at_id', 'user_high_id', 'last_message_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Conversation {self.user_low_id}-{self.user_high_id}>'
+
+    def other_id(self, user_id):
+        return self.user_high_id if self.user_low_id == user_id else self.user_low_id
+
 class Notifications(db.Model):
     __tablename__ = 'notifications'
 
     id = db.Column(db.Integer, primary_key=True)
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    content = db.Column(db.String(30))
+    content = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.now)
     read = db.Column(db.Boolean, default=False)
+    # Set on notifications generated by notify.py; count > 1 when a burst of
+    # the same event on the same target was coalesced into one notification.
+    type = db.Column(db.String(20))
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
+    count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __table_args__ = (
+        db.Index('idx_notifications_receiver_id_created_at_id', 'receiver_id', 'created_at', 'id'),
+        db.Index('idx_notifications_receiver_id_type_post_id', 'receiver_id', 'type', 'post_id'),
+        # Partial: only unread rows, so unread counts and mark-read cost what
+        # is unread rather than everything a user was ever notified of.
+        db.Index(
+            'idx_notifications_receiver_id_id_unread', 'receiver_id', 'id',
+            postgresql_where=(read == False), sqlite_where=(read == False)
+        ),
+    )
 
     def __repr__(self):
         return f'<Notification {self.id}>'
@@ -309,7 +573,11 @@ class Notifications(db.Model):
             'user_id': self.receiver_id,
             'content': self.content,
             'created_at': self.created_at,
-            'read': self.read
+            'read': self.read,
+            'type': self.type,
+            'actor_id': self.actor_id,
+            'post_id': self.post_id,
+            'count': self.count
         }
 
 class Settings(db.Model):
@@ -327,3 +595,68 @@ class Settings(db.Model):
             'user_id': self.user_id,
             'preferences': self.preferences
         }
+
+class CollectionVersion(db.Model):
+    __tablename__ = 'collection_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<CollectionVersion {self.name}={self.version}>'
+
+class RevokedToken(db.Model):
+    # Logged out JWTs, shared by every worker. Rows are only needed until the
+    # token would have expired anyway; see revocation.py.
+    __tablename__ = 'revoked_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('idx_revoked_tokens_expires_at', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
+
+class UserRecommendation(db.Model):
+    # Precomputed "who to follow" suggestions per user; see recommendations.py.
+    __tablename__ = 'user_recommendations'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    mutual_count = db.Column(db.Integer, nullable=False, default=0)
+    shared_tags = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.Index('idx_user_recommendations_user_id_score', 'user_id', 'score'),
+    )
+
+    def __repr__(self):
+        return f'<UserRecommendation {self.user_id}->{self.candidate_id}>'
+
+class ArchiveChunk(db.Model):
+    # Expired notifications / messages moved out of the hot tables by
+    # retention.py: a zlib compressed JSON list of rows per owner, never
+    # updated once written except by rekey.py re-encrypting message content.
+    # peer_id is the other participant for messages.
+    __tablename__ = 'archive_chunks'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    peer_id = db.Column(db.Integer)
+    row_count = db.Column(db.Integer, nullable=False)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.Index('idx_archive_chunks_kind_user_id_id', 'kind', 'user_id', 'id'),
+        db.Index('idx_archive_chunks_kind_peer_id_id', 'kind', 'peer_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<ArchiveChunk {self.kind} {self.first_id}-{self.last_id}>'
@@ -0,0 +1,134 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, insert, update, delete, bindparam, cast, String
+from sqlalchemy.orm import Session
+from backend.models import db, Notifications, Settings, followers
+from backend.timeline import is_fanned_out
+
+# Server generated notifications. Handlers publish events while they make
+# their changes; nothing is written until the session commits, when every
+# event published in the transaction is delivered together: one query for
+# the recipients' preferences, one for coalescable notifications still open,
+# then a single executemany UPDATE and a single executemany INSERT.
+#
+# A recipient's preferences['notifications'] is either a bool for all of them
+# or a dict keyed by the preference names below; anything unset is on.
+KINDS = {
+    'follow': ('followers', 'started following you'),
+    'like': ('likes', 'liked your post'),
+    'comment': ('comments', 'commented on your post'),
+    'post': ('posts', 'published a new post'),
+}
+
+# An unread notification of one of these kinds that is younger than
+# COALESCE_SECONDS absorbs further events on the same target, turning into
+# "5 people liked your post" rather than five notifications.
+COALESCED = {'follow', 'like', 'comment'}
+COALESCE_SECONDS = 3600
+CHUNK_SIZE = 1000
+
+
+def publish(kind, actor_id, receiver_ids, post_id=None):
+    queued = db.session.info.setdefault('notifications', [])
+    queued.extend((kind, actor_id, receiver_id, post_id) for receiver_id in receiver_ids if receiver_id != actor_id)
+
+
+def new_post(post):
+    # Authors too big to fan out on write don't notify either, like their
+    # timelines.
+    if not is_fanned_out(post.author_id):
+        return
+    follower_ids = db.session.scalars(
+        select(followers.c.follower_id).where(followers.c.followed_id == post.author_id)
+    ).all()
+    publish('post', post.author_id, follower_ids, post.id)
+
+
+def remove_post(post_id):
+    db.session.execute(delete(Notifications).where(Notifications.post_id == post_id))
+
+
+def wants(preferences, kind):
+    setting = (preferences or {}).get('notifications', True)
+    if isinstance(setting, dict):
+        return bool(setting.get(KINDS[kind][0], True))
+    return bool(setting)
+
+
+def chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def deliver(session, events):
+    receiver_ids = {receiver_id for _, _, receiver_id, _ in events}
+    preferences = {}
+    for chunk in chunks(receiver_ids):
+        preferences.update(session.execute(
+            select(Settings.user_id, Settings.preferences).where(Settings.user_id.in_(chunk))
+        ).all())
+
+    # Equal events in the same transaction are merged up front; the latest
+    # actor is the one named on the notification.
+    counts = Counter()
+    actors = {}
+    for kind, actor_id, receiver_id, post_id in events:
+        if wants(preferences.get(receiver_id), kind):
+            key = (receiver_id, kind, post_id)
+            counts[key] += 1
+            actors[key] = actor_id
+    if not counts:
+        return
+
+    table = Notifications.__table__
+    now = datetime.now()
+    open_ids = {}
+    coalesced = {key[0] for key in counts if key[1] in COALESCED}
+    for chunk in chunks(coalesced):
+        rows = session.execute(
+            select(table.c.id, table.c.receiver_id, table.c.type, table.c.post_id).where(
+                table.c.receiver_id.in_(chunk),
+                table.c.type.in_(COALESCED),
+                table.c.read.is_(False),
+                table.c.created_at >= now - timedelta(seconds=COALESCE_SECONDS)
+            ).order_by(table.c.id)
+        ).all()
+        open_ids.update(((receiver_id, kind, post_id), notification_id) for notification_id, receiver_id, kind, post_id in rows)
+
+    updates, inserts = [], []
+    for key, count in counts.items():
+        receiver_id, kind, post_id = key
+        if kind in COALESCED and key in open_ids:
+            updates.append({'notification_id': open_ids[key], 'added': count, 'actor': actors[key], 'phrase': KINDS[kind][1]})
+        else:
+            content = KINDS[kind][1] if count == 1 else f'{count} people {KINDS[kind][1]}'
+            inserts.append({
+                'receiver_id': receiver_id, 'content': content, 'created_at': now, 'read': False,
+                'type': kind, 'actor_id': actors[key], 'post_id': post_id, 'count': count
+            })
+
+    if updates:
+        total = table.c.count + bindparam('added')
+        session.execute(
+            update(table).where(table.c.id == bindparam('notification_id')).values(
+                count=total,
+                actor_id=bindparam('actor'),
+                content=cast(total, String) + ' people ' + bindparam('phrase')
+            ),
+            updates
+        )
+    if inserts:
+        session.execute(insert(table), inserts)
+
+
+@event.listens_for(Session, 'before_commit')
+def deliver_notifications(session):
+    events = session.info.pop('notifications', None)
+    if events:
+        deliver(session, events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_notifications(session):
+    session.info.pop('notifications', None)
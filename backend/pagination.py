@@ -0,0 +1,138 @@
+import base64
+import binascii
+import json
+from itertools import islice
+from datetime import datetime
+from flask import request, make_response, jsonify, current_app, Response, stream_with_context
+from flask_restful import abort
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+NDJSON = 'application/x-ndjson'
+STREAM_BATCH_SIZE = 500
+
+
+class Keyset:
+    # Ordered, unique set of columns a list is paginated on, e.g.
+    # Keyset(Post.created_at, Post.id). The last column must be unique so
+    # every row has a distinct position.
+    def __init__(self, *columns, descending=True):
+        self.columns = columns
+        self.descending = descending
+
+    def order_by(self):
+        return [column.desc() if self.descending else column.asc() for column in self.columns]
+
+    def after(self, values):
+        # (a, b) < (x, y) expanded to (a < x) OR (a = x AND b < y) so it can
+        # use the same composite index as the ORDER BY on any backend.
+        clauses = []
+        for i, column in enumerate(self.columns):
+            equal = [self.columns[j] == values[j] for j in range(i)]
+            past = column < values[i] if self.descending else column > values[i]
+            clauses.append(and_(*equal, past))
+        return or_(*clauses)
+
+    def position(self, row):
+        return [getattr(row, column.key) for column in self.columns]
+
+    def encode(self, row):
+        return encode_cursor(self.position(row))
+
+    def decode(self, cursor):
+        values = decode_cursor(cursor, len(self.columns))
+        try:
+            return [cursor_value(column, value) for column, value in zip(self.columns, values)]
+        except (TypeError, ValueError):
+            abort(400, message='Bad Request: Invalid cursor')
+
+
+def cursor_value(column, value):
+    # A cursor value back as the column's Python type; a value of any other
+    # type would otherwise reach the query and fail there.
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, python_type) or (isinstance(value, bool) and python_type is not bool):
+        raise TypeError(value)
+    return value
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        abort(400, message='Bad Request: Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != length:
+        abort(400, message='Bad Request: Invalid cursor')
+    return values
+
+
+def page_limit():
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate(query, keyset):
+    limit = page_limit()
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(keyset.after(keyset.decode(cursor)))
+
+    rows = query.order_by(*keyset.order_by()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, keyset.encode(rows[-1])
+    return rows, None
+
+
+def wants_stream():
+    return request.args.get('stream') == '1' or request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def stream_response(query, keyset, serialize):
+    # Writes the whole collection (from the cursor on, if given) as one JSON
+    # document per line. Rows are fetched STREAM_BATCH_SIZE at a time with a
+    # server-side cursor and serialized batch by batch, so memory stays flat
+    # no matter how large the table is.
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(keyset.after(keyset.decode(cursor)))
+    query = query.order_by(*keyset.order_by()).yield_per(STREAM_BATCH_SIZE)
+
+    def generate():
+        rows = iter(query)
+        while True:
+            batch = list(islice(rows, STREAM_BATCH_SIZE))
+            if not batch:
+                break
+            for item in serialize(batch):
+                yield current_app.json.dumps(item) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def paginated_response(query, keyset, serialize=lambda items: [item.to_dict() for item in items]):
+    if wants_stream():
+        return stream_response(query, keyset, serialize)
+
+    items, next_cursor = paginate(query, keyset)
+    return make_response(jsonify({
+        'data': serialize(items),
+        'next_cursor': next_cursor
+    }), 200)
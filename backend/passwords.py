@@ -0,0 +1,110 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, make_response, jsonify, abort
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing is deliberately CPU heavy, so it runs on a small process
+# pool instead of in the request worker. At most MAX_PENDING hashes per worker
+# process may be queued or running; past that requests are turned away with a
+# 429 straight away instead of piling up behind each other.
+HASH_METHOD = 'scrypt:32768:8:1'
+HASH_WORKERS = 2
+MAX_PENDING = 8
+HASH_TIMEOUT = 10
+RETRY_AFTER = 1
+
+pool = None
+pool_lock = threading.Lock()
+slots = None
+pending = set()
+
+
+def hash_in_worker(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def verify_in_worker(password_hash, password, method):
+    # A correct password on an outdated hash is rehashed in the same round
+    # trip, so login can upgrade it without a second submission.
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+def needs_rehash(password_hash, method=HASH_METHOD):
+    return password_hash.split('$', 1)[0] != method
+
+
+def config(name, default):
+    return current_app.config.get(name, default)
+
+
+def executor():
+    global pool, slots
+    if pool is None:
+        with pool_lock:
+            if pool is None:
+                slots = threading.BoundedSemaphore(config('PASSWORD_HASH_MAX_PENDING', MAX_PENDING))
+                # spawn, not fork, by default: the request worker may already be
+                # running threads (e.g. the batch pool) that fork would copy
+                # mid-flight.
+                pool = ProcessPoolExecutor(
+                    max_workers=config('PASSWORD_HASH_WORKERS', HASH_WORKERS),
+                    mp_context=multiprocessing.get_context(config('PASSWORD_HASH_START_METHOD', 'spawn'))
+                )
+    return pool
+
+
+def reset():
+    global pool
+    with pool_lock:
+        if pool is not None:
+            # cancel_futures needs Python 3.9; runtime.txt pins 3.8.
+            for future in list(pending):
+                future.cancel()
+            pool.shutdown(wait=False)
+            pool = None
+
+
+def unavailable(code, message):
+    response = make_response(jsonify({'message': message}), code)
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    abort(response)
+
+
+def run(fn, *args):
+    workers = executor()
+    if not slots.acquire(blocking=False):
+        unavailable(429, 'Too many password checks in progress, try again shortly')
+    try:
+        future = workers.submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        slots.release()
+        reset()
+        unavailable(503, 'Password service unavailable')
+    pending.add(future)
+    future.add_done_callback(lambda _: slots.release())
+    future.add_done_callback(pending.discard)
+
+    try:
+        return future.result(timeout=config('PASSWORD_HASH_TIMEOUT', HASH_TIMEOUT))
+    except TimeoutError:
+        future.cancel()
+        unavailable(503, 'Password service unavailable')
+    except BrokenProcessPool:
+        reset()
+        unavailable(503, 'Password service unavailable')
+
+
+def hash_password(password):
+    return run(hash_in_worker, password, config('PASSWORD_HASH_METHOD', HASH_METHOD))
+
+
+def verify_password(password_hash, password):
+    # Returns (matches, new_hash); new_hash is set when the stored hash used
+    # older parameters than PASSWORD_HASH_METHOD and should be replaced.
+    return run(verify_in_worker, password_hash, password, config('PASSWORD_HASH_METHOD', HASH_METHOD))
@@ -0,0 +1,28 @@
+from flask_jwt_extended import get_current_user
+
+# The authenticated user as described by the access token's claims. It is
+# built from the verified token by the user_lookup_loader, so authorization
+# checks need no users query. The claims are trusted until the user's
+# token_version is bumped, which revokes every token carrying the old one.
+
+
+class Principal:
+    def __init__(self, id, is_admin, token_version):
+        self.id = id
+        self.is_admin = is_admin
+        self.token_version = token_version
+
+    def __repr__(self):
+        return f'<Principal {self.id}>'
+
+
+def claims_for(user):
+    return {'is_admin': bool(user.is_admin), 'token_version': user.token_version}
+
+
+def from_claims(jwt_data):
+    return Principal(jwt_data['sub'], jwt_data.get('is_admin', False), jwt_data.get('token_version'))
+
+
+def current_principal():
+    return get_current_user()
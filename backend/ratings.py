@@ -0,0 +1,81 @@
+from collections import defaultdict
+from sqlalchemy import update, delete, case, cast, literal, null
+from sqlalchemy.dialects import postgresql, sqlite
+from backend.models import db, Post, Rating, RatingStatus, PostStats
+from backend import trending, notify
+
+MAX_BULK_RATINGS = 100
+
+COUNTERS = {
+    RatingStatus.LIKE: 'likes_count',
+    RatingStatus.DISLIKE: 'dislikes_count',
+}
+
+UPSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def upsert(user_id, statuses):
+    # One INSERT ... SELECT FROM posts ... ON CONFLICT DO UPDATE for any
+    # number of posts. Selecting from posts skips ids that don't exist, and
+    # previous_status is set from the conflicting row, so the returned rows
+    # say what changed: (id, post_id, status, previous_status), with
+    # previous_status None for new ratings.
+    table = Rating.__table__
+    rows = db.session.query(
+        Post.id,
+        literal(user_id),
+        cast(case({post_id: status.name for post_id, status in statuses.items()}, value=Post.id), table.c.status.type),
+        null()
+    ).filter(Post.id.in_(list(statuses)))
+
+    insert = UPSERTS[db.session.get_bind().dialect.name]
+    statement = insert(table).from_select(['post_id', 'user_id', 'status', 'previous_status'], rows.statement)
+    statement = statement.on_conflict_do_update(
+        index_elements=['post_id', 'user_id'],
+        set_={'status': statement.excluded.status, 'previous_status': table.c.status}
+    ).returning(table.c.id, table.c.post_id, table.c.status, table.c.previous_status)
+    return db.session.execute(statement).all()
+
+
+def change(rating_id, post_id, user_id, status):
+    table = Rating.__table__
+    return db.session.execute(
+        update(table)
+        .where(table.c.id == rating_id, table.c.post_id == post_id, table.c.user_id == user_id)
+        .values(previous_status=table.c.status, status=status)
+        .returning(table.c.previous_status)
+    ).first()
+
+
+def remove(user_id, post_ids, rating_id=None):
+    table = Rating.__table__
+    statement = delete(table).where(table.c.user_id == user_id, table.c.post_id.in_(post_ids))
+    if rating_id is not None:
+        statement = statement.where(table.c.id == rating_id)
+    return db.session.execute(statement.returning(table.c.post_id, table.c.status)).all()
+
+
+def apply_changes(user_id, changes):
+    # changes: (post_id, previous status, new status) with None meaning no
+    # rating. Nets the counter deltas per post and writes each post once.
+    deltas = defaultdict(lambda: defaultdict(int))
+    for post_id, previous, current in changes:
+        if previous in COUNTERS:
+            deltas[post_id][COUNTERS[previous]] -= 1
+        if current in COUNTERS:
+            deltas[post_id][COUNTERS[current]] += 1
+
+    changed = [post_id for post_id, counters in deltas.items() if any(counters.values())]
+    for post_id in changed:
+        PostStats.increment(post_id, **deltas[post_id])
+    if changed:
+        for post in Post.query.filter(Post.id.in_(changed)).all():
+            trending.refresh(post)
+
+    liked = [post_id for post_id, previous, current in changes if current == RatingStatus.LIKE and previous != RatingStatus.LIKE]
+    if liked:
+        for post_id, author_id in db.session.query(Post.id, Post.author_id).filter(Post.id.in_(liked)):
+            notify.publish('like', user_id, [author_id], post_id)
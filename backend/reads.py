@@ -0,0 +1,119 @@
+from collections import defaultdict
+from sqlalchemy import select, and_
+from sqlalchemy.orm import aliased
+from backend.models import db, Post, User, Category, Tag, Comment, PostStats, post_tags, followers, POST_FIELDS
+from backend import trending
+
+# Read path for the hottest list endpoints. It selects explicit columns and
+# maps the row tuples straight to the dicts the endpoints return, so no ORM
+# objects are built: no identity map, no attribute instrumentation, no
+# to_dict. Output matches the to_dict based responses key for key.
+
+USER_COLUMNS = (User.id, User.username, User.email, User.profile_pic, User.followers_count, User.following_count, User.is_admin)
+
+# Column behind every POST_FIELDS name that is a plain column of the joined
+# posts / users / categories rows. Counters and tags are loaded separately.
+POST_COLUMNS = {
+    'id': Post.id,
+    'author': User.username,
+    'author_id': Post.author_id,
+    'category_id': Post.category_id,
+    'category_name': Category.name,
+    'title': Post.title,
+    'content': Post.content,
+    'excerpt': Post.excerpt,
+    'created_at': Post.created_at,
+    'updated_at': Post.updated_at,
+}
+
+
+def as_dicts(rows):
+    return [row._asdict() for row in rows]
+
+
+def recommended_users(limit=10):
+    rows = db.session.execute(
+        select(*USER_COLUMNS).where(User.is_admin.is_(False)).order_by(User.followers_count.desc()).limit(limit)
+    )
+    return as_dicts(rows)
+
+
+def categories():
+    return as_dicts(db.session.execute(select(Category.id, Category.name)))
+
+
+def tags_query():
+    # Row query for keyset pagination; serialize its pages with as_dicts.
+    return db.session.query(Tag.id, Tag.name)
+
+
+def follow_list_query(user_id, viewer_id, direction):
+    # Followers of user_id (direction='followers') or the users it follows
+    # ('following'), newest first, with is_followed telling whether viewer_id
+    # follows each of them, all in one query. Keyset on
+    # (followers.created_at, users.id); serialize pages with follow_list_rows.
+    if direction == 'followers':
+        listed, owner = followers.c.follower_id, followers.c.followed_id
+    else:
+        listed, owner = followers.c.followed_id, followers.c.follower_id
+    viewer_follows = aliased(followers)
+    return db.session.query(
+        *USER_COLUMNS,
+        followers.c.created_at,
+        viewer_follows.c.follower_id.isnot(None).label('is_followed')
+    ).select_from(followers).join(User, User.id == listed).outerjoin(
+        viewer_follows,
+        and_(viewer_follows.c.follower_id == viewer_id, viewer_follows.c.followed_id == User.id)
+    ).filter(owner == user_id)
+
+
+def follow_list_rows(rows):
+    result = as_dicts(rows)
+    for item in result:
+        del item['created_at']
+    return result
+
+
+def user_comments(user_id):
+    return as_dicts(db.session.execute(select(Comment.id, Comment.content).where(Comment.user_id == user_id)))
+
+
+def popular_posts(limit=trending.DEFAULT_LIMIT, category_id=None, window_hours=None, fields=None):
+    fields = fields or list(POST_FIELDS)
+    columns = [POST_COLUMNS[name].label(name) for name in fields if name in POST_COLUMNS]
+    query = db.session.query(Post.id.label('post_id'), *columns)
+    if 'author' in fields:
+        query = query.join(User, User.id == Post.author_id)
+    if 'category_name' in fields:
+        query = query.join(Category, Category.id == Post.category_id)
+
+    rows = trending.top_posts(limit, category_id, window_hours, query=query)
+    post_ids = [row.post_id for row in rows]
+    if not post_ids:
+        return []
+
+    stats = {}
+    if set(fields) & set(PostStats.COUNTERS):
+        stats = PostStats.totals(post_ids)
+
+    tags = defaultdict(list)
+    if 'tags' in fields:
+        tag_rows = db.session.execute(
+            select(post_tags.c.post_id, Tag.name).join(Tag, Tag.id == post_tags.c.tag_id).where(post_tags.c.post_id.in_(post_ids))
+        )
+        for post_id, name in tag_rows:
+            tags[post_id].append(name)
+
+    result = []
+    for row in rows:
+        values = row._asdict()
+        item = {}
+        for name in fields:
+            if name in POST_COLUMNS:
+                item[name] = values[name]
+            elif name == 'tags':
+                item[name] = tags[row.post_id]
+            else:
+                item[name] = stats[row.post_id][name]
+        result.append(item)
+    return result
@@ -0,0 +1,192 @@
+import math
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, delete, func, literal, and_
+from sqlalchemy.orm import aliased
+from backend.models import db, User, Rating, RatingStatus, UserRecommendation, followers, post_tags
+from backend.ratings import UPSERTS
+from backend.timeline import FANOUT_FOLLOWER_LIMIT
+from backend.reads import USER_COLUMNS, as_dicts
+
+# "Who to follow" suggestions. A candidate is anybody the user doesn't follow
+# yet who is followed by people the user follows (friends of friends) or who
+# liked posts with the same tags as the user. Candidates are scored by
+#
+#   MUTUAL_WEIGHT * mutual follows + TAG_WEIGHT * shared tags
+#     + POPULARITY_WEIGHT * log(1 + followers)
+#
+# and the best RECOMMENDATIONS_PER_USER are stored in user_recommendations by
+# refresh_all(), run as a background job (python -m backend.recommendations).
+# Follow / unfollow adjust the stored rows incrementally in between.
+MUTUAL_WEIGHT = 1.0
+TAG_WEIGHT = 0.5
+POPULARITY_WEIGHT = 0.1
+RECOMMENDATIONS_PER_USER = 50
+TAG_CANDIDATES = 200
+REFRESH_BATCH_SIZE = 100
+REFRESH_SECONDS = 6 * 3600
+
+
+def score(mutual_count, shared_tags, followers_count):
+    return MUTUAL_WEIGHT * mutual_count + TAG_WEIGHT * shared_tags + POPULARITY_WEIGHT * math.log1p(followers_count or 0)
+
+
+def liked_tags(user_ids):
+    # (user_id, tag_id) pairs for the tags of posts each user liked.
+    return select(Rating.user_id, post_tags.c.tag_id).join(
+        post_tags, post_tags.c.post_id == Rating.post_id
+    ).where(Rating.user_id.in_(user_ids), Rating.status == RatingStatus.LIKE).distinct()
+
+
+def compute(user_id):
+    # Returns {candidate_id: (score, mutual_count, shared_tags)} for one user.
+    followed = select(followers.c.followed_id).where(followers.c.follower_id == user_id)
+    friends = aliased(followers)
+    mutuals = dict(db.session.execute(
+        select(friends.c.followed_id, func.count()).select_from(followers).join(
+            friends, friends.c.follower_id == followers.c.followed_id
+        ).where(
+            followers.c.follower_id == user_id,
+            friends.c.followed_id != user_id,
+            friends.c.followed_id.not_in(followed)
+        ).group_by(friends.c.followed_id)
+    ).all())
+
+    mine = liked_tags([user_id]).subquery()
+    theirs = select(Rating.user_id, post_tags.c.tag_id).join(
+        post_tags, post_tags.c.post_id == Rating.post_id
+    ).where(Rating.status == RatingStatus.LIKE, Rating.user_id != user_id).distinct().subquery()
+    shared = dict(db.session.execute(
+        select(theirs.c.user_id, func.count()).join(mine, mine.c.tag_id == theirs.c.tag_id).where(
+            theirs.c.user_id.not_in(followed)
+        ).group_by(theirs.c.user_id).order_by(func.count().desc()).limit(TAG_CANDIDATES)
+    ).all())
+
+    candidates = set(mutuals) | set(shared)
+    if not candidates:
+        return {}
+    users = db.session.execute(
+        select(User.id, User.followers_count).where(User.id.in_(candidates), User.is_admin.is_not(True))
+    ).all()
+
+    scored = {
+        candidate_id: (score(mutuals.get(candidate_id, 0), shared.get(candidate_id, 0), followers_count),
+                       mutuals.get(candidate_id, 0), shared.get(candidate_id, 0))
+        for candidate_id, followers_count in users
+    }
+    best = sorted(scored, key=lambda candidate_id: scored[candidate_id][0], reverse=True)[:RECOMMENDATIONS_PER_USER]
+    return {candidate_id: scored[candidate_id] for candidate_id in best}
+
+
+def refresh(user_id):
+    table = UserRecommendation.__table__
+    db.session.execute(delete(table).where(table.c.user_id == user_id))
+    now = datetime.now()
+    rows = [
+        {'user_id': user_id, 'candidate_id': candidate_id, 'score': value,
+         'mutual_count': mutual_count, 'shared_tags': shared_tags, 'computed_at': now}
+        for candidate_id, (value, mutual_count, shared_tags) in compute(user_id).items()
+    ]
+    if rows:
+        db.session.execute(insert(table), rows)
+
+
+def refresh_all():
+    last_id = 0
+    while True:
+        user_ids = db.session.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(REFRESH_BATCH_SIZE)
+        ).all()
+        if not user_ids:
+            break
+        for user_id in user_ids:
+            refresh(user_id)
+        db.session.commit()
+        last_id = user_ids[-1]
+
+
+def followed(user_id, followed_ids):
+    # user_id started following followed_ids: those stop being suggestions
+    # for user_id, and each becomes a mutual more for everybody who follows
+    # user_id. New friends of friends for user_id, and users with too many
+    # followers to touch in a request, wait for the next refresh_all().
+    table = UserRecommendation.__table__
+    db.session.execute(delete(table).where(table.c.user_id == user_id, table.c.candidate_id.in_(followed_ids)))
+    if not followed_ids or not within_limit(user_id):
+        return
+
+    admins = set(db.session.scalars(select(User.id).where(User.id.in_(followed_ids), User.is_admin.is_(True))))
+    upsert = UPSERTS[db.session.get_bind().dialect.name]
+    for followed_id in followed_ids:
+        if followed_id in admins:
+            continue
+        already = select(followers.c.follower_id).where(followers.c.followed_id == followed_id)
+        rows = select(
+            followers.c.follower_id,
+            literal(followed_id),
+            literal(MUTUAL_WEIGHT),
+            literal(1),
+            literal(0),
+            literal(datetime.now())
+        ).where(
+            followers.c.followed_id == user_id,
+            followers.c.follower_id != followed_id,
+            followers.c.follower_id.not_in(already)
+        )
+        statement = upsert(table).from_select(
+            ['user_id', 'candidate_id', 'score', 'mutual_count', 'shared_tags', 'computed_at'], rows
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'candidate_id'],
+            set_={'score': table.c.score + MUTUAL_WEIGHT, 'mutual_count': table.c.mutual_count + 1}
+        ))
+
+
+def unfollowed(user_id, followed_ids):
+    # The reverse of followed(): one mutual less for user_id's followers, and
+    # suggestions that were only there through this edge go away. user_id's
+    # own list catches up at the next refresh_all().
+    if not followed_ids or not within_limit(user_id):
+        return
+
+    table = UserRecommendation.__table__
+    audience = select(followers.c.follower_id).where(followers.c.followed_id == user_id)
+    for followed_id in followed_ids:
+        match = and_(table.c.candidate_id == followed_id, table.c.user_id.in_(audience), table.c.mutual_count > 0)
+        db.session.execute(table.update().where(match).values(
+            score=table.c.score - MUTUAL_WEIGHT,
+            mutual_count=table.c.mutual_count - 1
+        ))
+    db.session.execute(delete(table).where(
+        table.c.candidate_id.in_(followed_ids),
+        table.c.user_id.in_(audience),
+        table.c.mutual_count == 0,
+        table.c.shared_tags == 0
+    ))
+
+
+def within_limit(user_id):
+    followers_count = db.session.execute(select(User.followers_count).where(User.id == user_id)).scalar()
+    return (followers_count or 0) <= FANOUT_FOLLOWER_LIMIT
+
+
+def recommended_users(user_id, limit=10):
+    # Same fields as reads.recommended_users(), which it falls back to.
+    rows = db.session.execute(
+        select(*USER_COLUMNS).select_from(UserRecommendation).join(User, User.id == UserRecommendation.candidate_id).where(
+            UserRecommendation.user_id == user_id
+        ).order_by(UserRecommendation.score.desc()).limit(limit)
+    )
+    return as_dicts(rows)
+
+
+if __name__ == '__main__':
+    from backend.app import app
+
+    with app.app_context():
+        while True:
+            refresh_all()
+            if '--once' in sys.argv:
+                break
+            time.sleep(REFRESH_SECONDS)
@@ -0,0 +1,107 @@
+import json
+import zlib
+from sqlalchemy import select, update, bindparam
+from backend.models import db, Messages, ArchiveChunk
+from backend.encryption import key_ring
+
+# Re-encrypts stored message content with the first key in
+# MESSAGE_ENCRYPTION_KEYS, after a new key has been put in front:
+#
+#   python -m backend.rekey
+#
+# Messages are walked in id order BATCH_SIZE at a time, one transaction per
+# batch. Content already under the current key is left alone, a row edited
+# while its batch was being re-encrypted keeps the edit, and content no key
+# can read is skipped and counted.
+BATCH_SIZE = 500
+ARCHIVE_BATCH_SIZE = 20
+
+
+def rekey_messages(ring):
+    table = Messages.__table__
+    last_id, rotated, unreadable = 0, 0, 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.content).where(table.c.id > last_id).order_by(table.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        stale = []
+        for message_id, content in rows:
+            if ring.is_current(content):
+                continue
+            new = ring.rotate(content)
+            if new is None:
+                unreadable += 1
+            else:
+                stale.append({'message_id': message_id, 'old': content, 'new': new})
+        if stale:
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('message_id'), table.c.content == bindparam('old'))
+                .values(content=bindparam('new')),
+                stale
+            )
+        db.session.commit()
+        rotated += len(stale)
+        last_id = rows[-1].id
+    return rotated, unreadable
+
+
+def rekey_archive(ring):
+    # Archived messages keep their content encrypted inside the compressed
+    # payload, so their chunks are rewritten too or dropping the old key
+    # would make them unreadable.
+    table = ArchiveChunk.__table__
+    last_id, rotated, unreadable = 0, 0, 0
+    while True:
+        chunks = db.session.execute(
+            select(table.c.id, table.c.payload)
+            .where(table.c.kind == 'message', table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(ARCHIVE_BATCH_SIZE)
+        ).all()
+        if not chunks:
+            break
+        changed = []
+        for chunk_id, payload in chunks:
+            rows = json.loads(zlib.decompress(payload))
+            stale = 0
+            for row in rows:
+                if ring.is_current(row['content']):
+                    continue
+                new = ring.rotate(row['content'])
+                if new is None:
+                    unreadable += 1
+                else:
+                    row['content'] = new
+                    stale += 1
+            if stale:
+                changed.append({'chunk_id': chunk_id, 'new': zlib.compress(json.dumps(rows).encode())})
+                rotated += stale
+        if changed:
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('chunk_id')).values(payload=bindparam('new')),
+                changed
+            )
+        db.session.commit()
+        last_id = chunks[-1].id
+    return rotated, unreadable
+
+
+def run():
+    ring = key_ring()
+    messages, unreadable_messages = rekey_messages(ring)
+    archived, unreadable_archived = rekey_archive(ring)
+    return {
+        'messages': messages,
+        'archived messages': archived,
+        'unreadable messages': unreadable_messages,
+        'unreadable archived messages': unreadable_archived
+    }
+
+
+if __name__ == '__main__':
+    from backend.app import app
+
+    with app.app_context():
+        print('Re-encrypted', run())
@@ -0,0 +1,146 @@
+import json
+import sys
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, insert, delete, and_, or_
+from backend.models import db, Notifications, Messages, ArchiveChunk, serialize_messages
+
+# Retention for the tables that only ever grow. Rows past their policy's age
+# are moved into archive_chunks BATCH_SIZE at a time, one short transaction
+# per batch: DELETE ... RETURNING takes them out of the hot table and the
+# same transaction appends them, compressed and grouped per owner, as new
+# chunks. archived() pages through a user's chunks newest first.
+#
+# Runs as a background job (python -m backend.retention [--once]); the ages
+# can be overridden per kind with app.config['RETENTION_DAYS'].
+BATCH_SIZE = 500
+RUN_SECONDS = 24 * 60 * 60
+CHUNK_FETCH = 8
+
+
+class Policy:
+    def __init__(self, model, days, expired, owner, order_by, serialize=lambda items: [item.to_dict() for item in items]):
+        self.model = model
+        self.days = days
+        self.expired = expired
+        self.owner = owner
+        self.order_by = order_by
+        self.serialize = serialize
+
+
+POLICIES = {
+    # Read notifications a month old.
+    'notification': Policy(
+        Notifications, 30,
+        expired=lambda cutoff: and_(Notifications.read == True, Notifications.created_at < cutoff),
+        owner=lambda row: (row.receiver_id, None),
+        order_by=(Notifications.receiver_id, Notifications.id)
+    ),
+    # Messages a year old, archived once per conversation rather than per
+    # participant.
+    'message': Policy(
+        Messages, 365,
+        expired=lambda cutoff: Messages.created_at < cutoff,
+        owner=lambda row: (min(row.sender_id, row.recipient_id), max(row.sender_id, row.recipient_id)),
+        order_by=(Messages.sender_id, Messages.recipient_id, Messages.id),
+        serialize=serialize_messages
+    ),
+}
+
+
+def retention_days(kind):
+    return current_app.config.get('RETENTION_DAYS', {}).get(kind, POLICIES[kind].days)
+
+
+def pack(rows):
+    return zlib.compress(json.dumps(rows, default=lambda value: value.isoformat()).encode())
+
+
+def unpack(model, payload):
+    dates = [column.key for column in model.__table__.columns if column.type.python_type is datetime]
+    rows = json.loads(zlib.decompress(payload))
+    for row in rows:
+        for key in dates:
+            if row.get(key):
+                row[key] = datetime.fromisoformat(row[key])
+    return rows
+
+
+def archive_batch(kind, cutoff):
+    policy = POLICIES[kind]
+    table = policy.model.__table__
+    expired = select(table.c.id).where(policy.expired(cutoff)).order_by(*policy.order_by).limit(BATCH_SIZE)
+    rows = db.session.execute(delete(table).where(table.c.id.in_(expired)).returning(*table.c)).all()
+
+    groups = defaultdict(list)
+    for row in sorted(rows, key=lambda row: row.id):
+        groups[policy.owner(row)].append(row._asdict())
+
+    now = datetime.now()
+    chunks = [{
+        'kind': kind,
+        'user_id': user_id,
+        'peer_id': peer_id,
+        'row_count': len(items),
+        'first_id': items[0]['id'],
+        'last_id': items[-1]['id'],
+        'payload': pack(items),
+        'archived_at': now
+    } for (user_id, peer_id), items in groups.items()]
+    if chunks:
+        db.session.execute(insert(ArchiveChunk), chunks)
+    db.session.commit()
+    return len(rows)
+
+
+def run():
+    archived = {}
+    for kind in POLICIES:
+        cutoff = datetime.now() - timedelta(days=retention_days(kind))
+        archived[kind] = 0
+        while True:
+            count = archive_batch(kind, cutoff)
+            archived[kind] += count
+            if count < BATCH_SIZE:
+                break
+    return archived
+
+
+def archived(kind, user_id, limit, cursor=None):
+    # cursor: (chunk id, rows of that chunk already returned). Returns
+    # (to_dict()s newest first, next cursor or None).
+    policy = POLICIES[kind]
+    chunk_id, skip = cursor or (None, 0)
+    query = select(ArchiveChunk).where(
+        ArchiveChunk.kind == kind,
+        or_(ArchiveChunk.user_id == user_id, ArchiveChunk.peer_id == user_id)
+    )
+    if chunk_id is not None:
+        query = query.where(ArchiveChunk.id <= chunk_id)
+
+    items = []
+    chunks = db.session.scalars(query.order_by(ArchiveChunk.id.desc()).execution_options(yield_per=CHUNK_FETCH))
+    for chunk in chunks:
+        if len(items) == limit:
+            return items, (chunk.id, 0)
+        offset = skip if chunk.id == chunk_id else 0
+        rows = unpack(policy.model, chunk.payload)[::-1][offset:]
+        taken = rows[:limit - len(items)]
+        items.extend(policy.serialize([policy.model(**row) for row in taken]))
+        if len(taken) < len(rows):
+            return items, (chunk.id, offset + len(taken))
+    return items, None
+
+
+if __name__ == '__main__':
+    from backend.app import app
+
+    with app.app_context():
+        while True:
+            app.logger.info('Archived %s', run())
+            if '--once' in sys.argv:
+                break
+            time.sleep(RUN_SECONDS)
@@ -0,0 +1,158 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import create_engine, select, insert, delete, func
+from sqlalchemy.exc import IntegrityError
+from backend.models import db, RevokedToken
+
+# Logged out tokens live in the revoked_tokens table, in the app database by
+# default or in the database at JWT_REVOCATION_DATABASE_URI (e.g. a SQLite
+# file next to the workers), so a logout is seen by every worker. Each worker
+# keeps a Bloom filter of the revoked jtis: a token that isn't in the filter
+# was never revoked, so the common check needs no I/O. Only filter hits are
+# confirmed against the table.
+SYNC_SECONDS = 1
+COMPACT_SECONDS = 3600
+BLOOM_CAPACITY = 100000
+BLOOM_ERROR_RATE = 0.001
+# Ids are handed out at insert but become visible at commit, so a revocation
+# can show up after one with a higher id has been synced. Every sync re-reads
+# this many ids below the highest one seen to pick those up.
+SYNC_ID_OVERLAP = 1000
+
+table = RevokedToken.__table__
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], 'little')
+        b = int.from_bytes(digest[8:], 'little') | 1
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+def utc_from_timestamp(exp):
+    return datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+
+class RevocationStore:
+    def __init__(self, engine, sync_seconds=SYNC_SECONDS, compact_seconds=COMPACT_SECONDS, capacity=BLOOM_CAPACITY):
+        self.engine = engine
+        self.sync_seconds = sync_seconds
+        self.compact_seconds = compact_seconds
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.filter = BloomFilter(capacity)
+        self.last_id = 0
+        self.synced_at = None
+        self.compacted_at = None
+
+    def revoke(self, jti, exp=None):
+        expires_at = utc_from_timestamp(exp) if exp else None
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(insert(table).values(jti=jti, expires_at=expires_at))
+        except IntegrityError:
+            pass
+        with self.lock:
+            self.filter.add(jti)
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self.filter:
+            return False
+        with self.engine.connect() as connection:
+            return connection.execute(select(table.c.id).where(table.c.jti == jti)).first() is not None
+
+    def sync(self):
+        # Picks up tokens revoked by other workers at most every
+        # sync_seconds, so a logout elsewhere takes effect within that delay.
+        now = time.monotonic()
+        if self.synced_at is not None and now - self.synced_at < self.sync_seconds:
+            return
+        with self.lock:
+            if self.synced_at is not None and now - self.synced_at < self.sync_seconds:
+                return
+            with self.engine.begin() as connection:
+                if self.compacted_at is None or now - self.compacted_at >= self.compact_seconds:
+                    self.compact(connection)
+                    self.compacted_at = now
+                else:
+                    rows = connection.execute(
+                        select(table.c.id, table.c.jti).where(table.c.id > self.last_id - SYNC_ID_OVERLAP)
+                    ).fetchall()
+                    for row in rows:
+                        if row.jti not in self.filter:
+                            self.filter.add(row.jti)
+                        self.last_id = max(self.last_id, row.id)
+                    if self.filter.count > self.filter.capacity:
+                        self.rebuild(connection)
+            self.synced_at = now
+
+    def compact(self, connection):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        connection.execute(delete(table).where(table.c.expires_at < now))
+        self.rebuild(connection)
+
+    def rebuild(self, connection):
+        # Bloom filters can't forget, so compaction builds a fresh one from the
+        # rows that are left, sized for twice as many as there are now.
+        count = connection.execute(select(func.count()).select_from(table)).scalar()
+        bloom = BloomFilter(max(self.capacity, count * 2))
+        last_id = 0
+        for row in connection.execute(select(table.c.id, table.c.jti)):
+            bloom.add(row.jti)
+            last_id = max(last_id, row.id)
+        self.filter, self.last_id = bloom, last_id
+
+
+def version_key(user_id, token_version):
+    return f'user:{user_id}:v{token_version}'
+
+
+def revoke_token_version(user_id, token_version):
+    # Revokes every token issued with this version, so the entry has to
+    # outlive the longest lived (refresh) token.
+    lifetime = current_app.config.get('JWT_REFRESH_TOKEN_EXPIRES')
+    store().revoke(version_key(user_id, token_version), time.time() + lifetime.total_seconds() if lifetime else None)
+
+
+store_lock = threading.Lock()
+
+
+def store():
+    app = current_app._get_current_object()
+    if 'revocation' not in app.extensions:
+        with store_lock:
+            if 'revocation' not in app.extensions:
+                uri = app.config.get('JWT_REVOCATION_DATABASE_URI')
+                if uri:
+                    engine = create_engine(uri)
+                    table.create(engine, checkfirst=True)
+                else:
+                    engine = db.engine
+                app.extensions['revocation'] = RevocationStore(
+                    engine,
+                    sync_seconds=app.config.get('JWT_REVOCATION_SYNC_SECONDS', SYNC_SECONDS),
+                    compact_seconds=app.config.get('JWT_REVOCATION_COMPACT_SECONDS', COMPACT_SECONDS)
+                )
+    return app.extensions['revocation']
@@ -0,0 +1,221 @@
+import re
+from sqlalchemy import event, inspect, text, bindparam
+from sqlalchemy.orm import Session
+from backend.models import db, Post, Comment, User, Tag
+from backend.pagination import encode_cursor
+
+# Every searchable row is one document in the search_index table. The
+# document id is derived from the row's kind and primary key so updates and
+# deletes are primary key lookups on both backends.
+KINDS = ['post', 'comment', 'user', 'tag']
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+
+def document_id(kind, ref_id):
+    return ref_id * len(KINDS) + KINDS.index(kind)
+
+
+def document_for(obj):
+    if isinstance(obj, Post):
+        return 'post', obj.id, obj.title or '', obj.content or '', ('title', 'content')
+    if isinstance(obj, Comment):
+        return 'comment', obj.id, '', obj.content or '', ('content',)
+    if isinstance(obj, User):
+        return 'user', obj.id, obj.username or '', '', ('username',)
+    if isinstance(obj, Tag):
+        return 'tag', obj.id, obj.name or '', '', ('name',)
+    return None
+
+
+def query_terms(q):
+    return re.findall(r'\w+', q or '', flags=re.UNICODE)
+
+
+class SqliteSearch:
+    # FTS5 virtual table: search_index(kind UNINDEXED, ref_id UNINDEXED, title, body)
+    # with rowid as the document id.
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, title, body, tokenize = 'porter unicode61')"
+        ))
+
+    def index(self, connection, kind, ref_id, title, body):
+        doc_id = document_id(kind, ref_id)
+        connection.execute(text("DELETE FROM search_index WHERE rowid = :doc_id"), {'doc_id': doc_id})
+        connection.execute(text(
+            "INSERT INTO search_index (rowid, kind, ref_id, title, body) "
+            "VALUES (:doc_id, :kind, :ref_id, :title, :body)"
+        ), {'doc_id': doc_id, 'kind': kind, 'ref_id': ref_id, 'title': title, 'body': body})
+
+    def remove(self, connection, kind, ref_id):
+        connection.execute(text("DELETE FROM search_index WHERE rowid = :doc_id"), {'doc_id': document_id(kind, ref_id)})
+
+    def search(self, connection, terms, kinds, limit, after):
+        # Quote every term so user input can't inject FTS5 syntax, and let the
+        # last one prefix match for search-as-you-type.
+        match = ' '.join('"%s"' % term for term in terms[:-1])
+        match = (match + ' "%s"*' % terms[-1]).strip()
+        params = {'match': match, 'kinds': kinds, 'limit': limit}
+        page_filter = ''
+        if after:
+            page_filter = "AND (score < :score OR (score = :score AND doc_id < :doc_id))"
+            params.update(score=after[0], doc_id=after[1])
+
+        rows = connection.execute(text(
+            "SELECT doc_id, kind, ref_id, title, score FROM ("
+            "  SELECT rowid AS doc_id, kind, ref_id, title, -bm25(search_index, 0, 0, 10.0, 1.0) AS score"
+            "  FROM search_index WHERE search_index MATCH :match AND kind IN :kinds"
+            ") WHERE 1 = 1 " + page_filter +
+            " ORDER BY score DESC, doc_id DESC LIMIT :limit"
+        ).bindparams(bindparam('kinds', expanding=True)), params).fetchall()
+        if not rows:
+            return []
+
+        snippets = dict(connection.execute(text(
+            "SELECT rowid, snippet(search_index, -1, :start, :end, '...', 16) FROM search_index "
+            "WHERE search_index MATCH :match AND rowid IN :doc_ids"
+        ).bindparams(bindparam('doc_ids', expanding=True)), {
+            'match': match,
+            'start': HIGHLIGHT_START,
+            'end': HIGHLIGHT_END,
+            'doc_ids': [row.doc_id for row in rows]
+        }).fetchall())
+        return [(row.doc_id, row.kind, row.ref_id, row.title, row.score, snippets.get(row.doc_id)) for row in rows]
+
+
+class PostgresSearch:
+    # Plain table with a weighted tsvector column and a GIN index on it:
+    # search_index(doc_id, kind, ref_id, title, body, document).
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS search_index ("
+            "doc_id BIGINT PRIMARY KEY, kind VARCHAR(16) NOT NULL, ref_id INTEGER NOT NULL, "
+            "title TEXT NOT NULL, body TEXT NOT NULL, document TSVECTOR NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_search_index_document ON search_index USING GIN (document)"
+        ))
+
+    def index(self, connection, kind, ref_id, title, body):
+        connection.execute(text(
+            "INSERT INTO search_index (doc_id, kind, ref_id, title, body, document) "
+            "VALUES (:doc_id, :kind, :ref_id, :title, :body, "
+            "setweight(to_tsvector('english', :title), 'A') || setweight(to_tsvector('english', :body), 'B')) "
+            "ON CONFLICT (doc_id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body, document = EXCLUDED.document"
+        ), {'doc_id': document_id(kind, ref_id), 'kind': kind, 'ref_id': ref_id, 'title': title, 'body': body})
+
+    def remove(self, connection, kind, ref_id):
+        connection.execute(text("DELETE FROM search_index WHERE doc_id = :doc_id"), {'doc_id': document_id(kind, ref_id)})
+
+    def search(self, connection, terms, kinds, limit, after):
+        tsquery = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+        params = {'tsquery': tsquery, 'kinds': kinds, 'limit': limit}
+        page_filter = ''
+        if after:
+            page_filter = "AND (score < :score OR (score = :score AND doc_id < :doc_id))"
+            params.update(score=after[0], doc_id=after[1])
+
+        # ts_headline is expensive, so it only runs on the rows of this page.
+        rows = connection.execute(text(
+            "SELECT doc_id, kind, ref_id, title, score, "
+            "ts_headline('english', CASE WHEN body = '' THEN title ELSE body END, to_tsquery('english', :tsquery), "
+            "'StartSel=" + HIGHLIGHT_START + ", StopSel=" + HIGHLIGHT_END + ", MaxWords=16, MinWords=6') AS snippet "
+            "FROM ("
+            "  SELECT doc_id, kind, ref_id, title, body, "
+            "  CAST(ts_rank_cd(document, to_tsquery('english', :tsquery)) AS double precision) AS score"
+            "  FROM search_index WHERE document @@ to_tsquery('english', :tsquery) AND kind IN :kinds"
+            ") AS matches WHERE 1 = 1 " + page_filter +
+            " ORDER BY score DESC, doc_id DESC LIMIT :limit"
+        ).bindparams(bindparam('kinds', expanding=True)), params).fetchall()
+        return [(row.doc_id, row.kind, row.ref_id, row.title, row.score, row.snippet) for row in rows]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearch(),
+    'postgresql': PostgresSearch(),
+}
+
+
+def backend_for(connection):
+    return BACKENDS.get(connection.dialect.name)
+
+
+def available():
+    return backend_for(db.session.connection()) is not None
+
+
+def find(q, kinds, limit, after=None):
+    terms = query_terms(q)
+    connection = db.session.connection()
+    backend = backend_for(connection)
+    if backend is None or not terms:
+        return [], None
+
+    rows = backend.search(connection, terms, kinds, limit + 1, after)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][4], rows[-1][0]])
+
+    comment_ids = [ref_id for _, kind, ref_id, _, _, _ in rows if kind == 'comment']
+    comment_posts = dict(db.session.query(Comment.id, Comment.post_id).filter(Comment.id.in_(comment_ids)).all()) if comment_ids else {}
+
+    results = []
+    for doc_id, kind, ref_id, title, score, snippet in rows:
+        result = {'type': kind, 'id': ref_id, 'title': title, 'snippet': snippet, 'score': score}
+        if kind == 'comment':
+            result['post_id'] = comment_posts.get(ref_id)
+        results.append(result)
+    return results, next_cursor
+
+
+def unindex(kind, ref_ids):
+    # For rows removed with a bulk delete, which sync_search_index never sees.
+    connection = db.session.connection()
+    backend = backend_for(connection)
+    if backend is None:
+        return
+    for ref_id in ref_ids:
+        backend.remove(connection, kind, ref_id)
+
+
+# search_index is dialect specific DDL, so db.create_all() / drop_all() (used by
+# seed.py) handle it here; deployed databases get it from the migration.
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    backend = backend_for(connection)
+    if backend is not None:
+        backend.create(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if backend_for(connection) is not None:
+        connection.execute(text("DROP TABLE IF EXISTS search_index"))
+
+
+@event.listens_for(Session, 'after_flush')
+def sync_search_index(session, flush_context):
+    changed = [obj for obj in session.new if document_for(obj)]
+    for obj in session.dirty:
+        document = document_for(obj)
+        if document and any(inspect(obj).attrs[name].history.has_changes() for name in document[4]):
+            changed.append(obj)
+    removed = [obj for obj in session.deleted if document_for(obj)]
+    if not changed and not removed:
+        return
+
+    connection = session.connection()
+    backend = backend_for(connection)
+    if backend is None:
+        return
+
+    for obj in changed:
+        kind, ref_id, title, body, _ = document_for(obj)
+        backend.index(connection, kind, ref_id, title, body)
+    for obj in removed:
+        kind, ref_id, _, _, _ = document_for(obj)
+        backend.remove(connection, kind, ref_id)
@@ -6,9 +6,10 @@ import json
 import random
 from werkzeug.security import generate_password_hash
 from app import app
-from models import db, User, UserProfile, Rating, Post, Category, followers, Settings, UserFavourites, Comment, Tag, Messages, Attachment, RatingStatus, post_tags, Notifications
+from models import db, User, UserProfile, Rating, Post, Category, followers, Settings, UserFavourites, Comment, Tag, Messages, Attachment, RatingStatus, post_tags, Notifications, PostStats, make_excerpt
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import select
+from backend import timeline, trending
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -68,20 +69,24 @@ def create_posts(users, categories, num=30):
     posts = []
     for _ in range(num):
         author = choice(users)
+        content = fake.text(max_nb_chars=500)
         post = Post(
             title=fake.sentence(),
-            content=fake.text(max_nb_chars=500),
+            content=content,
+            excerpt=make_excerpt(content),
             author_id=author.id,
             category_id=choice(categories).id,
             created_at=fake.date_time_between(start_date="-30d", end_date="now"),
-            # comments_count=fake.random_int(min=0, max=20),
-            # likes_count=fake.random_int(min=0, max=50),
-            # dislikes_count=fake.random_int(min=0, max=20)
         )
         posts.append(post)
 
     try:
         db.session.add_all(posts)
+        db.session.flush()
+        for post in posts:
+            PostStats.create_shards(post.id)
+            timeline.fan_out_post(post)
+            trending.track(post)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -134,12 +139,14 @@ def create_ratings(posts, users, n=100, min_posts_with_ratings=2):
         ratings.append(rating)
 
         if status == RatingStatus.LIKE:
-            post.likes_count += 1
+            PostStats.increment(post.id, likes_count=1)
         elif status == RatingStatus.DISLIKE:
-            post.dislikes_count += 1
+            PostStats.increment(post.id, dislikes_count=1)
 
         posts_with_ratings.add(post)
 
+    for post in posts_with_ratings:
+        trending.refresh(post)
     db.session.commit()
     return ratings
 
@@ -165,10 +172,16 @@ def create_comments(posts, users, num=100, min_posts_with_comments=2):
         )
         comments.append(comment)
         
-        post.comments_count += 1
+        PostStats.increment(post.id, comments_count=1)
         posts_with_comments.add(post)
 
     db.session.add_all(comments)
+    db.session.flush()
+    for comment in comments:
+        comment.path = f'{comment.id:010d}/'
+        comment.thread_id = comment.id
+    for post in posts_with_comments:
+        trending.refresh(post)
     db.session.commit()
     return comments
 def create_notifications(users):
@@ -219,6 +232,8 @@ def create_user_favourites(users, posts, num=100):
             user_favourites.append(user_favourite)
 
     db.session.add_all(user_favourites)
+    for user_favourite in user_favourites:
+        trending.refresh(db.session.get(Post, user_favourite.post_id), favourites_delta=1)
     db.session.commit()
     return user_favourites
 
@@ -0,0 +1,210 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from flask import current_app
+from sqlalchemy import select, func
+from backend.models import db, Notifications, Messages
+
+# Server-Sent Events for new notifications and messages.
+#
+# One broker thread per worker process polls the notifications and messages
+# tables for ids past the last ones it saw (a single indexed query per table
+# per tick, however many clients are connected) and wakes the streams of the
+# users those rows belong to. Every stream then reads its own user's rows past
+# its cursor, which is also what it resumes from after a reconnect, so wake
+# ups can be coalesced or lost without losing events.
+#
+# Ids are handed out at insert but become visible at commit, and the
+# notification fan-out commits many rows at once, so a row can appear below a
+# cursor that has already moved past it. Each read therefore starts from a
+# floor, the cursor as it was SETTLE_SECONDS + KEEPALIVE_SECONDS ago, and skips
+# the ids it has already sent. The floor travels in the event id too, so
+# after a reconnect rows from the last few seconds may be sent again; the id
+# in their data tells them apart.
+#
+# A stream holds a thread while it is open, so run the web workers with
+# threads (gunicorn --worker-class gthread) and size them as
+#
+#   --threads = MAX_STREAMS + the threads the rest of the API needs
+#
+# MAX_STREAMS (SSE_MAX_STREAMS) is kept to a fifth of Procfile.dev's 50
+# threads, so 40 per process are never taken by streams; past it /stream
+# answers 503 and EventSource retries. Each stream closes after
+# STREAM_SECONDS and EventSource reconnects by itself with Last-Event-ID.
+POLL_SECONDS = 0.5
+KEEPALIVE_SECONDS = 15
+STREAM_SECONDS = 300
+RETRY_MILLISECONDS = 3000
+# Longest a transaction is expected to take between inserting a row and
+# committing it.
+SETTLE_SECONDS = 30
+MAX_STREAMS = 10
+BATCH_SIZE = 100
+
+SOURCES = {
+    'notification': (Notifications, Notifications.receiver_id),
+    'message': (Messages, Messages.recipient_id),
+}
+
+
+class Broker:
+    def __init__(self, app, max_streams=MAX_STREAMS):
+        self.app = app
+        self.max_streams = max_streams
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+        self.count = 0
+        self.last_ids = None
+        self.thread = None
+
+    def subscribe(self, user_id):
+        with self.lock:
+            if self.count >= self.max_streams:
+                return None
+            wakeups = queue.Queue(maxsize=1)
+            self.subscribers[user_id].add(wakeups)
+            self.count += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='stream-broker', daemon=True)
+                self.thread.start()
+            return wakeups
+
+    def unsubscribe(self, user_id, wakeups):
+        with self.lock:
+            if wakeups not in self.subscribers.get(user_id, ()):
+                return
+            self.subscribers[user_id].discard(wakeups)
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+            self.count -= 1
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self.poll()
+                except Exception:
+                    self.app.logger.exception('Stream broker poll failed')
+                time.sleep(POLL_SECONDS)
+
+    def poll(self):
+        with db.engine.connect() as connection:
+            if self.last_ids is None:
+                self.last_ids = {
+                    kind: connection.execute(select(func.coalesce(func.max(model.id), 0))).scalar()
+                    for kind, (model, _) in SOURCES.items()
+                }
+                return
+
+            users = set()
+            for kind, (model, owner) in SOURCES.items():
+                rows = connection.execute(
+                    select(model.id, owner).where(model.id > self.last_ids[kind]).order_by(model.id)
+                ).all()
+                if rows:
+                    self.last_ids[kind] = rows[-1][0]
+                    users.update(user_id for _, user_id in rows)
+
+        with self.lock:
+            for user_id in users:
+                for wakeups in self.subscribers.get(user_id, ()):
+                    try:
+                        wakeups.put_nowait(True)
+                    except queue.Full:
+                        pass
+
+
+broker_lock = threading.Lock()
+
+
+def broker():
+    app = current_app._get_current_object()
+    if 'stream_broker' not in app.extensions:
+        with broker_lock:
+            if 'stream_broker' not in app.extensions:
+                app.extensions['stream_broker'] = Broker(app, app.config.get('SSE_MAX_STREAMS', MAX_STREAMS))
+    return app.extensions['stream_broker']
+
+
+def encode_event_id(cursor, floor):
+    return f"{cursor['notification']}.{cursor['message']}.{floor['notification']}.{floor['message']}"
+
+
+def decode_event_id(event_id):
+    # (cursor, floor), or None. Ids from before floors were added have only
+    # the cursor.
+    try:
+        parts = [int(part) for part in event_id.split('.')]
+    except (AttributeError, ValueError):
+        return None
+    if len(parts) == 2:
+        parts += parts
+    if len(parts) != 4:
+        return None
+    return {'notification': parts[0], 'message': parts[1]}, {'notification': parts[2], 'message': parts[3]}
+
+
+def latest_cursor(user_id):
+    cursor = {}
+    for kind, (model, owner) in SOURCES.items():
+        cursor[kind] = db.session.query(func.coalesce(func.max(model.id), 0)).filter(owner == user_id).scalar()
+    db.session.rollback()
+    return cursor
+
+
+def pending(user_id, cursor, floor, sent):
+    # Everything for user_id past the floor that hasn't been sent yet, oldest
+    # first. The transaction is ended straight away so an idle stream doesn't
+    # hold one open.
+    events = []
+    for kind, (model, owner) in SOURCES.items():
+        query = model.query.filter(owner == user_id, model.id > floor[kind])
+        if sent[kind]:
+            query = query.filter(model.id.not_in(sent[kind]))
+        rows = query.order_by(model.id).limit(BATCH_SIZE).all()
+        events.extend((row.created_at, kind, row) for row in rows)
+    events.sort(key=lambda event: (event[0] is None, event[0]))
+
+    payloads = []
+    for _, kind, row in events:
+        cursor[kind] = max(cursor[kind], row.id)
+        sent[kind].add(row.id)
+        payloads.append(format_event(kind, encode_event_id(cursor, floor), row.to_dict()))
+    db.session.rollback()
+    return payloads
+
+
+def format_event(kind, event_id, data):
+    return f'id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+def events(user_id, cursor, floor, wakeups):
+    # The caller unsubscribes wakeups when the response is closed.
+    yield f'retry: {RETRY_MILLISECONDS}\n\n'
+    deadline = time.monotonic() + STREAM_SECONDS
+    # Reads happen at least every KEEPALIVE_SECONDS, so a row committed up to
+    # SETTLE_SECONDS late is still above the cursor of a read that old.
+    window = SETTLE_SECONDS + KEEPALIVE_SECONDS
+    history = deque()
+    sent = {kind: set() for kind in SOURCES}
+    while True:
+        now = time.monotonic()
+        history.append((now, dict(cursor)))
+        while len(history) > 1 and history[1][0] <= now - window:
+            history.popleft()
+        if history[0][0] <= now - window:
+            floor = history[0][1]
+            for kind in sent:
+                sent[kind] = {row_id for row_id in sent[kind] if row_id > floor[kind]}
+        payloads = pending(user_id, cursor, floor, sent)
+        yield from payloads
+        if len(payloads) >= BATCH_SIZE:
+            continue
+        if time.monotonic() >= deadline:
+            return
+        try:
+            wakeups.get(timeout=min(KEEPALIVE_SECONDS, max(0, deadline - time.monotonic())))
+        except queue.Empty:
+            yield ': keep-alive\n\n'
@@ -0,0 +1,119 @@
+from sqlalchemy import insert, delete, select, literal, exists, true
+from backend.models import db, Post, User, TimelineEntry, followers
+from backend.pagination import Keyset, paginate, page_limit, encode_cursor
+
+# Authors above this many followers are not fanned out on write; their posts
+# are pulled into followers' timelines at read time instead.
+FANOUT_FOLLOWER_LIMIT = 1000
+BACKFILL_POSTS = 200
+
+
+def is_fanned_out(author_id):
+    followers_count = db.session.query(User.followers_count).filter_by(id=author_id).scalar()
+    return (followers_count or 0) <= FANOUT_FOLLOWER_LIMIT
+
+
+def fan_out_post(post):
+    db.session.execute(insert(TimelineEntry).values(
+        user_id=post.author_id,
+        post_id=post.id,
+        author_id=post.author_id,
+        created_at=post.created_at
+    ))
+
+    if not is_fanned_out(post.author_id):
+        return
+
+    recipients = select(
+        followers.c.follower_id,
+        literal(post.id),
+        literal(post.author_id),
+        literal(post.created_at)
+    ).where(followers.c.followed_id == post.author_id)
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'created_at'], recipients
+    ))
+
+
+def backfill(user_id, author_id):
+    if not is_fanned_out(author_id):
+        return
+
+    recent_posts = select(
+        literal(user_id),
+        Post.id,
+        Post.author_id,
+        Post.created_at
+    ).where(Post.author_id == author_id).order_by(Post.created_at.desc(), Post.id.desc()).limit(BACKFILL_POSTS)
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'created_at'], recent_posts
+    ))
+
+
+def refill(author_id):
+    # Call when author_id drops back to FANOUT_FOLLOWER_LIMIT followers. Posts
+    # they made while above it were only ever pulled at read time, and the
+    # pull stops now, so their recent posts go into every follower's timeline
+    # that doesn't have them yet.
+    recent_posts = select(Post.id, Post.created_at).where(Post.author_id == author_id).order_by(
+        Post.created_at.desc(), Post.id.desc()
+    ).limit(BACKFILL_POSTS).subquery()
+    rows = select(
+        followers.c.follower_id,
+        recent_posts.c.id,
+        literal(author_id),
+        recent_posts.c.created_at
+    ).select_from(followers.join(recent_posts, true())).where(
+        followers.c.followed_id == author_id,
+        ~exists().where(TimelineEntry.user_id == followers.c.follower_id, TimelineEntry.post_id == recent_posts.c.id)
+    )
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'created_at'], rows
+    ))
+
+
+def prune(user_id, author_id):
+    db.session.execute(delete(TimelineEntry).where(
+        TimelineEntry.user_id == user_id,
+        TimelineEntry.author_id == author_id
+    ))
+
+
+def remove_post(post_id):
+    db.session.execute(delete(TimelineEntry).where(TimelineEntry.post_id == post_id))
+
+
+def home_timeline(user_id, options=()):
+    # Merge the materialized entries with posts pulled from followed authors
+    # that are too large to fan out. Both sides are keyset pages on
+    # (created_at, post id), so the merged page shares the same cursor.
+    fanned, fanned_next = paginate(
+        db.session.query(TimelineEntry.created_at, TimelineEntry.post_id).filter(TimelineEntry.user_id == user_id),
+        Keyset(TimelineEntry.created_at, TimelineEntry.post_id)
+    )
+
+    pulled_authors = db.session.query(followers.c.followed_id).join(
+        User, User.id == followers.c.followed_id
+    ).filter(
+        followers.c.follower_id == user_id,
+        User.followers_count > FANOUT_FOLLOWER_LIMIT
+    )
+    pulled, pulled_next = paginate(
+        db.session.query(Post.created_at, Post.id).filter(Post.author_id.in_(pulled_authors)),
+        Keyset(Post.created_at, Post.id)
+    )
+
+    positions = {}
+    for created_at, post_id in list(fanned) + list(pulled):
+        positions[post_id] = (created_at, post_id)
+    merged = sorted(positions.values(), reverse=True)
+
+    limit = page_limit()
+    next_cursor = None
+    if fanned_next or pulled_next or len(merged) > limit:
+        merged = merged[:limit]
+        next_cursor = encode_cursor(merged[-1])
+
+    post_ids = [post_id for _, post_id in merged]
+    posts = {post.id: post for post in Post.query.options(*options).filter(Post.id.in_(post_ids)).all()} if post_ids else {}
+    return [posts[post_id] for post_id in post_ids if post_id in posts], next_cursor
@@ -0,0 +1,86 @@
+import math
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from backend.models import db, Post, PostStats, TrendingScore
+
+# Reddit style "hot" ranking: engagement counts on a log scale plus a bonus
+# that grows linearly with the post's age. The bonus only depends on
+# created_at, so a score never has to be recomputed as time passes, only when
+# the post's engagement changes, and newer posts outrank older ones with
+# DECAY_SECONDS less age per order of magnitude of engagement.
+EPOCH = datetime(2024, 1, 1)
+DECAY_SECONDS = 45000
+
+LIKE_WEIGHT = 1
+DISLIKE_WEIGHT = -1
+COMMENT_WEIGHT = 2
+FAVOURITE_WEIGHT = 3
+
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 50
+
+
+def hot_score(likes, dislikes, comments, favourites, created_at):
+    engagement = (
+        LIKE_WEIGHT * likes
+        + DISLIKE_WEIGHT * dislikes
+        + COMMENT_WEIGHT * comments
+        + FAVOURITE_WEIGHT * favourites
+    )
+    order = math.log10(max(abs(engagement), 1))
+    sign = (engagement > 0) - (engagement < 0)
+    age = (created_at - EPOCH).total_seconds()
+    return round(sign * order + age / DECAY_SECONDS, 7)
+
+
+def track(post):
+    entry = TrendingScore(
+        post_id=post.id,
+        category_id=post.category_id,
+        created_at=post.created_at,
+        favourites_count=0
+    )
+    entry.score = hot_score(0, 0, 0, 0, post.created_at)
+    db.session.add(entry)
+    return entry
+
+
+def refresh(post, favourites_delta=0):
+    # Called in the same transaction as the write that changed the post's
+    # counters, after they have been updated.
+    # favourites_count moves in the database, like the post_stats counters,
+    # so concurrent favourites can't overwrite each other's change.
+    favourites_count = db.session.execute(
+        update(TrendingScore).where(TrendingScore.post_id == post.id)
+        .values(favourites_count=TrendingScore.favourites_count + favourites_delta)
+        .returning(TrendingScore.favourites_count)
+    ).scalar()
+    if favourites_count is None:
+        favourites_count = track(post).favourites_count = favourites_delta
+        db.session.flush()
+    stats = PostStats.totals([post.id])[post.id]
+    db.session.execute(update(TrendingScore).where(TrendingScore.post_id == post.id).values(score=hot_score(
+        stats['likes_count'],
+        stats['dislikes_count'],
+        stats['comments_count'],
+        favourites_count,
+        post.created_at
+    )))
+
+
+def untrack(post_id):
+    TrendingScore.query.filter_by(post_id=post_id).delete()
+
+
+def top_posts(limit=DEFAULT_LIMIT, category_id=None, window_hours=None, query=None):
+    # query selects from posts: Post entities by default, or explicit columns
+    # for the row based read path.
+    if query is None:
+        query = Post.query
+    query = query.join(TrendingScore, TrendingScore.post_id == Post.id)
+    if category_id is not None:
+        query = query.filter(TrendingScore.category_id == category_id)
+    if window_hours is not None:
+        query = query.filter(TrendingScore.created_at >= datetime.now() - timedelta(hours=window_hours))
+    limit = max(1, min(limit, MAX_LIMIT))
+    return query.order_by(TrendingScore.score.desc()).limit(limit).all()
@@ -27,7 +27,7 @@ const FollowersList = () => {
                     }
                 });
 
-                setFollowers(response.data);
+                setFollowers(response.data.data);
                 setLoading(false);
             } catch (error) {
                 setError('Failed to load followers');
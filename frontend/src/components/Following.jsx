@@ -27,7 +27,7 @@ const FollowingList = () => {
                     }
                 });
 
-                setFollowing(response.data);
+                setFollowing(response.data.data);
                 setLoading(false);
             } catch (error) {
                 setError('Failed to load following');
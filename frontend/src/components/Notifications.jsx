@@ -10,23 +10,25 @@ import NavigationBar from './NavigationBar';
 const NotificationsPage = () => {
   const [notifications, setNotifications] = useState([]);
   const [hasMore, setHasMore] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const navigate = useNavigate();
 
-  const fetchNotifications = async (page = 1) => {
+  const fetchNotifications = async (cursor = null) => {
     try {
       setLoading(true);
       const token = localStorage.getItem('access_token');
-      const response = await axios.get(`https://techtalk-app.onrender.com/notifications?page=${page}`, {
+      const response = await axios.get(`https://techtalk-app.onrender.com/notifications${cursor ? `?cursor=${cursor}` : ''}`, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
-      const newNotifications = response.data;
+      const newNotifications = response.data.data;
 
       setNotifications((prev) => [...prev, ...newNotifications]);
-      setHasMore(newNotifications.length > 0);
+      setNextCursor(response.data.next_cursor);
+      setHasMore(Boolean(response.data.next_cursor));
     } catch (err) {
       setError('Failed to load notifications.');
     } finally {
@@ -48,8 +50,7 @@ const NotificationsPage = () => {
   };
 
   const handleLoadMore = () => {
-    const nextPage = Math.ceil(notifications.length / 10) + 1;
-    fetchNotifications(nextPage);
+    fetchNotifications(nextCursor);
   };
 
   useEffect(() => {
@@ -63,7 +63,7 @@ const OtherUserProfile = () => {
                     'Authorization': `Bearer ${localStorage.getItem('access_token')}`
                 }
             });
-            setPosts(response.data);
+            setPosts(response.data.data);
         } catch (error) {
             setError('Failed to fetch posts');
             console.error('Error fetching posts:', error);
@@ -21,7 +21,7 @@ const PostCreationForm = () => {
                     axios.get(`${baseUrl}/tags`),
                     axios.get(`${baseUrl}/categories`)
                 ]);
-                setTags(tagsResponse.data);
+                setTags(tagsResponse.data.data);
                 setCategories(categoriesResponse.data);
             } catch (error) {
                 console.error('Error fetching tags and categories:', error);
@@ -64,7 +64,7 @@ const UserProfile = () => {
                     'Authorization': `Bearer ${localStorage.getItem('access_token')}`
                 }
             });
-            setPosts(response.data);
+            setPosts(response.data.data);
         } catch (error) {
             setError('Failed to fetch posts');
             console.error('Error fetching posts:', error);